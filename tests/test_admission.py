@@ -0,0 +1,54 @@
+import asyncio
+
+import pytest
+
+from utrequestboard.admission import AdmissionController, AdmissionRejected
+
+
+def test_other_guild_is_admitted_while_one_guild_is_queued():
+    async def main():
+        adm = AdmissionController(max_inflight=50, max_inflight_per_guild=1, max_queue=1, queue_timeout=1)
+        release = asyncio.Event()
+
+        async def hold(guild_id: int):
+            async with adm.admit(guild_id):
+                await release.wait()
+
+        first = asyncio.create_task(hold(1))
+        await asyncio.sleep(0)
+        queued = asyncio.create_task(hold(1))
+        await asyncio.sleep(0)
+        assert adm.inflight == 1 and adm.waiting == 1
+
+        # サーバー1が詰まっていても、サーバー2は待たずに入れる
+        async with adm.admit(2):
+            assert adm.inflight == 2
+        assert adm.shed == 0
+
+        release.set()
+        await asyncio.gather(first, queued)
+        assert adm.inflight == 0 and adm.admitted == 3
+
+    asyncio.run(main())
+
+
+def test_full_queue_is_shed():
+    async def main():
+        adm = AdmissionController(max_inflight=1, max_inflight_per_guild=1, max_queue=1, queue_timeout=1)
+        release = asyncio.Event()
+
+        async def hold(guild_id: int):
+            async with adm.admit(guild_id):
+                await release.wait()
+
+        tasks = [asyncio.create_task(hold(1)), asyncio.create_task(hold(2))]
+        await asyncio.sleep(0)
+        with pytest.raises(AdmissionRejected):
+            async with adm.admit(3):
+                pass
+        assert adm.shed_by_guild[3] == 1
+
+        release.set()
+        await asyncio.gather(*tasks)
+
+    asyncio.run(main())
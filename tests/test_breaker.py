@@ -0,0 +1,127 @@
+import asyncio
+import time
+
+import pytest
+
+from utrequestboard.breaker import BreakerRegistry, CircuitBreaker, CircuitOpenError, OperationTimeoutError
+
+
+async def fail():
+    raise RuntimeError("boom")
+
+
+async def ok():
+    return "ok"
+
+
+def test_opens_after_threshold_and_rejects_without_running():
+    async def main():
+        registry = BreakerRegistry(failure_threshold=2, reset_timeout=60)
+        for _ in range(2):
+            with pytest.raises(RuntimeError):
+                await registry.call("database", fail())
+        breaker = registry.get("database")
+        assert breaker.state == CircuitBreaker.OPEN
+
+        coro = ok()
+        with pytest.raises(CircuitOpenError):
+            await registry.call("database", coro)
+        assert coro.cr_frame is None  # 実行せずに閉じている
+        assert breaker.total_rejected == 1
+
+        # 他の名前には影響しない
+        assert await registry.call("discord.fetch_channel", ok()) == "ok"
+
+    asyncio.run(main())
+
+
+def test_half_open_allows_one_trial():
+    async def main():
+        registry = BreakerRegistry(failure_threshold=1, reset_timeout=0.05)
+        with pytest.raises(RuntimeError):
+            await registry.call("database", fail())
+        breaker = registry.get("database")
+        time.sleep(0.06)
+
+        # 試している間は他を通さない
+        release = asyncio.Event()
+
+        async def trial():
+            await release.wait()
+            return "ok"
+
+        task = asyncio.create_task(registry.call("database", trial()))
+        await asyncio.sleep(0)
+        assert breaker.state == CircuitBreaker.HALF_OPEN
+        with pytest.raises(CircuitOpenError):
+            await registry.call("database", ok())
+
+        release.set()
+        assert await task == "ok"
+        assert breaker.state == CircuitBreaker.CLOSED and breaker.failures == 0
+
+    asyncio.run(main())
+
+
+def test_failed_trial_reopens():
+    async def main():
+        registry = BreakerRegistry(failure_threshold=3, reset_timeout=0.05)
+        for _ in range(3):
+            with pytest.raises(RuntimeError):
+                await registry.call("database", fail())
+        time.sleep(0.06)
+        with pytest.raises(RuntimeError):
+            await registry.call("database", fail())
+        assert registry.get("database").state == CircuitBreaker.OPEN
+
+    asyncio.run(main())
+
+
+def test_timeout_counts_as_failure():
+    async def main():
+        registry = BreakerRegistry(failure_threshold=1, timeouts=dict(database=0.01))
+        with pytest.raises(OperationTimeoutError):
+            await registry.call("database", asyncio.sleep(1))
+        assert registry.get("database").state == CircuitBreaker.OPEN
+
+    asyncio.run(main())
+
+
+def test_errors_not_caused_by_dependency_are_not_counted():
+    async def main():
+        registry = BreakerRegistry(failure_threshold=1, is_failure=lambda e: not isinstance(e, ValueError))
+
+        async def invalid():
+            raise ValueError("bad input")
+
+        with pytest.raises(ValueError):
+            await registry.call("discord", invalid())
+        assert registry.get("discord").state == CircuitBreaker.CLOSED
+
+    asyncio.run(main())
+
+
+def test_cancel_does_not_count_and_releases_trial():
+    async def main():
+        registry = BreakerRegistry(failure_threshold=1, reset_timeout=0.05)
+        with pytest.raises(RuntimeError):
+            await registry.call("database", fail())
+        time.sleep(0.06)
+
+        task = asyncio.create_task(registry.call("database", asyncio.sleep(1)))
+        await asyncio.sleep(0)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        assert await registry.call("database", ok()) == "ok"
+
+    asyncio.run(main())
+
+
+def test_timeout_lookup_falls_back_to_prefix():
+    registry = BreakerRegistry(default_timeout=10, timeouts={
+        "discord.create_text_channel": 20, "database": 5, "database.rebuild_stats": None})
+    assert registry.get_timeout("discord.create_text_channel") == 20
+    assert registry.get_timeout("discord.fetch_channel") == 10
+    assert registry.get_timeout("database.replica.db1:3306") == 5
+    assert registry.get_timeout("database.rebuild_stats") is None
@@ -0,0 +1,74 @@
+import asyncio
+import contextvars
+import datetime
+import uuid
+import warnings
+
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from utrequestboard.abc import RequestOrder
+from utrequestboard.breaker import BreakerRegistry, CircuitBreaker
+from utrequestboard.database import RequestBoardDatabase
+from utrequestboard.database.option import SQLiteOption
+
+
+def new_order() -> RequestOrder:
+    return RequestOrder(board_id=uuid.uuid4(), created=datetime.datetime.now(), discord_user=1, mcid="", title="")
+
+
+async def connect(tmp_path) -> RequestBoardDatabase:
+    warnings.filterwarnings("ignore")
+    db = RequestBoardDatabase()
+    await db.connect(SQLiteOption(str(tmp_path / "test.db")))
+    return db
+
+
+def test_waiting_for_write_lock_is_not_a_database_timeout(tmp_path):
+    async def main():
+        db = await connect(tmp_path)
+        db.breakers = BreakerRegistry(failure_threshold=2, timeouts=dict(database=0.2))
+        try:
+            async def hold():
+                async with db.write_lock("other"):
+                    await asyncio.sleep(1)
+
+            holder = asyncio.create_task(hold())
+            await asyncio.sleep(0)
+            order_ids = await asyncio.gather(*(db.add_order(new_order()) for _ in range(4)))
+            await holder
+        finally:
+            await db.close()
+
+        assert len(set(order_ids)) == 4
+        assert db.breakers.get("database").state == CircuitBreaker.CLOSED
+        assert db.breakers.get("database").total_failures == 0
+
+    asyncio.run(main())
+
+
+def test_reads_stay_on_primary_after_write(tmp_path):
+    async def main():
+        db = await connect(tmp_path)
+        db.breakers = BreakerRegistry()
+        replica = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'replica.db'}")
+        db._read_engines = [replica]
+        db._sticky_seconds = 60
+        try:
+            assert db.read_engine() is replica
+            before_write = contextvars.copy_context()
+
+            # デコレータ経由の書き込み
+            order_id = await db.add_order(new_order())
+            assert db.read_engine() is db._engine
+
+            # modify_order 経由の書き込み
+            async def update():
+                assert db.read_engine() is replica
+                await db.update_order(order_id, dict(title="changed"))
+                assert db.read_engine() is db._engine
+
+            await asyncio.create_task(update(), context=before_write)
+        finally:
+            await db.close()
+
+    asyncio.run(main())
@@ -0,0 +1,72 @@
+import asyncio
+import datetime
+import multiprocessing
+import uuid
+import warnings
+
+from utrequestboard.abc import RequestOrder
+from utrequestboard.database import RequestBoardDatabase
+from utrequestboard.database.lock import MySQLAdvisoryLock
+from utrequestboard.database.option import SQLiteOption
+
+ORDER_ID = uuid.UUID(int=1)
+PROCESSES = 4
+INCREMENTS = 50
+
+
+async def _connect(path: str) -> RequestBoardDatabase:
+    warnings.filterwarnings("ignore")
+    db = RequestBoardDatabase()
+    await db.connect(SQLiteOption(path), "file")
+    return db
+
+
+async def _increment(path: str):
+    db = await _connect(path)
+    try:
+        for _ in range(INCREMENTS):
+            async with db.modify_order(ORDER_ID) as order:
+                value = order.discord_user
+                await asyncio.sleep(0)  # 他のプロセスが割り込める隙を作る
+                order.discord_user = value + 1
+    finally:
+        await db.close()
+
+
+def _worker(path: str):
+    asyncio.run(_increment(path))
+
+
+def test_write_lock_serializes_processes_sharing_sqlite_file(tmp_path):
+    path = str(tmp_path / "shared.db")
+
+    async def setup():
+        db = await _connect(path)
+        await db.add_order(RequestOrder(
+            id=ORDER_ID, board_id=ORDER_ID, created=datetime.datetime.now(), discord_user=0, mcid="", title=""))
+        await db.close()
+
+    async def result():
+        db = await _connect(path)
+        try:
+            return (await db.get_order_record(ORDER_ID, primary=True)).discord_user
+        finally:
+            await db.close()
+
+    asyncio.run(setup())
+    processes = [multiprocessing.Process(target=_worker, args=(path,)) for _ in range(PROCESSES)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join(60)
+        assert process.exitcode == 0
+
+    assert asyncio.run(result()) == PROCESSES * INCREMENTS
+
+
+def test_mysql_lock_keys_stay_short_and_distinct():
+    lock = MySQLAdvisoryLock(lambda: None, "a_very_long_database_name_used_by_this_request_board:")
+    keys = {lock.key(f"order:{uuid.UUID(int=i).hex}") for i in range(100)}
+    assert len(keys) == 100
+    assert all(len(key) <= 64 for key in keys)
+    assert MySQLAdvisoryLock(lambda: None, "other:").key("outbox") != lock.key("outbox")
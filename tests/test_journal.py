@@ -0,0 +1,93 @@
+import asyncio
+import datetime
+import uuid
+
+import pytest
+
+from utrequestboard.abc import RequestOrder
+from utrequestboard.journal import OrderJournal, decode_order_values
+
+
+def new_order() -> RequestOrder:
+    return RequestOrder(
+        id=uuid.uuid4(), board_id=uuid.uuid4(), created=datetime.datetime(2024, 1, 2, 3, 4, 5), discord_user=1,
+        mcid="mcid", title="タイトル")
+
+
+def test_entries_survive_restart_in_order(tmp_path):
+    path = tmp_path / "journal.jsonl"
+    order = new_order()
+    closed = datetime.datetime(2024, 1, 3)
+
+    async def main():
+        journal = OrderJournal(path)
+        await journal.append_order(order, actions=("update",))
+        await journal.append_update(order.id, dict(discussion_closed=closed))
+
+    asyncio.run(main())
+
+    journal = OrderJournal(path)
+    journal.load()
+    added, updated = journal.entries()
+    assert added["op"] == "add_order" and added["actions"] == ["update"]
+    values = decode_order_values(added["order"])
+    assert values["id"] == order.id and values["created"] == order.created and values["title"] == "タイトル"
+    assert updated["op"] == "update_order" and uuid.UUID(updated["order_id"]) == order.id
+    assert decode_order_values(updated["values"]) == dict(discussion_closed=closed)
+
+
+def test_broken_last_line_is_skipped(tmp_path):
+    path = tmp_path / "journal.jsonl"
+
+    async def main():
+        await OrderJournal(path).append_update(uuid.uuid4(), dict(title="a"))
+
+    asyncio.run(main())
+    with path.open("a", encoding="utf-8") as file:
+        file.write('{"op": "update_or')
+
+    journal = OrderJournal(path)
+    journal.load()
+    assert len(journal) == 1
+
+
+def test_discard_keeps_remaining_entries(tmp_path):
+    path = tmp_path / "journal.jsonl"
+
+    async def main():
+        journal = OrderJournal(path)
+        for title in "abc":
+            await journal.append_update(uuid.uuid4(), dict(title=title))
+
+        # 反映できた先頭の２件だけ取り除く
+        await journal.discard(2)
+        reloaded = OrderJournal(path)
+        reloaded.load()
+        assert [e["values"]["title"] for e in reloaded.entries()] == ["c"]
+
+        await journal.discard(1)
+        assert not path.exists()
+
+    asyncio.run(main())
+
+
+def test_concurrent_appends_share_one_fsync(tmp_path):
+    async def main():
+        journal = OrderJournal(tmp_path / "journal.jsonl")
+        await asyncio.gather(*(journal.append_update(uuid.uuid4(), dict(title=str(i))) for i in range(20)))
+        assert journal.appended == 20
+        assert journal.fsyncs < 5
+        assert len(journal.entries()) == 20
+
+    asyncio.run(main())
+
+
+def test_failed_write_rejects_appenders(tmp_path):
+    async def main():
+        # 親ディレクトリがないので書き込めない
+        journal = OrderJournal(tmp_path / "missing" / "journal.jsonl")
+        with pytest.raises(OSError):
+            await journal.append_update(uuid.uuid4(), dict(title="a"))
+        assert len(journal) == 0
+
+    asyncio.run(main())
@@ -0,0 +1,93 @@
+import asyncio
+import time
+import types
+
+import discord
+
+from utrequestboard.cache import MemberCache
+
+
+class FakeGuild:
+    def __init__(self, guild_id: int = 1, members: dict = None):
+        self.id = guild_id
+        self.members = members or {}
+        self.fetches = 0
+
+    def get_member(self, user_id: int):
+        return None  # 常にキャッシュにないものとして取得させる
+
+    async def fetch_member(self, user_id: int):
+        self.fetches += 1
+        if user_id not in self.members:
+            raise discord.NotFound(types.SimpleNamespace(status=404, reason="Not Found"), "Unknown Member")
+        return self.members[user_id]
+
+
+def test_member_is_cached_until_ttl():
+    async def main():
+        member = types.SimpleNamespace(id=10)
+        guild = FakeGuild(members={10: member})
+        cache = MemberCache(ttl=60)
+        assert await cache.get(guild, 10) is member
+        assert await cache.get(guild, 10) is member
+        assert guild.fetches == 1
+
+        cache.invalidate(guild.id, 10)
+        assert await cache.get(guild, 10) is member
+        assert guild.fetches == 2
+
+    asyncio.run(main())
+
+
+def test_missing_member_is_negatively_cached_for_shorter_ttl():
+    async def main():
+        guild = FakeGuild()
+        cache = MemberCache(ttl=60, negative_ttl=0.05)
+        assert await cache.get(guild, 20) is None
+        assert await cache.get(guild, 20) is None
+        assert guild.fetches == 1
+
+        # 参加した後は、短い期限が切れれば見つかる
+        guild.members[20] = member = types.SimpleNamespace(id=20)
+        time.sleep(0.06)
+        assert await cache.get(guild, 20) is member
+        assert guild.fetches == 2
+
+    asyncio.run(main())
+
+
+def test_fetch_errors_are_not_cached():
+    async def main():
+        guild = FakeGuild()
+        cache = MemberCache()
+
+        async def fail(g, u):
+            raise discord.HTTPException(types.SimpleNamespace(status=500, reason="Server Error"), "error")
+
+        for _ in range(2):
+            try:
+                await cache.get(guild, 30, fetch=fail)
+            except discord.HTTPException:
+                pass
+        assert len(cache) == 0
+
+    asyncio.run(main())
+
+
+def test_least_recently_used_entry_is_evicted():
+    async def main():
+        guild = FakeGuild(members={i: types.SimpleNamespace(id=i) for i in range(3)})
+        cache = MemberCache(max_size=2)
+        await cache.get(guild, 0)
+        await cache.get(guild, 1)
+        await cache.get(guild, 0)  # 0 を最近使ったものにする
+        await cache.get(guild, 2)
+        assert len(cache) == 2
+
+        fetches = guild.fetches
+        await cache.get(guild, 0)
+        assert guild.fetches == fetches
+        await cache.get(guild, 1)
+        assert guild.fetches == fetches + 1
+
+    asyncio.run(main())
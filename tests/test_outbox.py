@@ -0,0 +1,163 @@
+import asyncio
+import datetime
+import types
+import uuid
+import warnings
+
+from sqlalchemy import inspect, select, text
+
+from utrequestboard.abc import OutboxTask, RequestOrder
+from utrequestboard.database import RequestBoardDatabase, impl
+from utrequestboard.database.option import SQLiteOption
+from utrequestboard.outbox import OutboxWorker
+
+
+def new_order() -> RequestOrder:
+    return RequestOrder(board_id=uuid.uuid4(), created=datetime.datetime.now(), discord_user=1, mcid="", title="")
+
+
+async def connect(tmp_path) -> RequestBoardDatabase:
+    warnings.filterwarnings("ignore")
+    db = RequestBoardDatabase()
+    await db.connect(SQLiteOption(str(tmp_path / "test.db")))
+    return db
+
+
+def test_re_request_in_same_second_is_not_lost(tmp_path, monkeypatch):
+    # DATETIME(0) の MySQL と同じく、登録時刻が秒単位でしか区別できない状態にする
+    now = datetime.datetime.now().replace(microsecond=0)
+
+    class FixedDateTime(datetime.datetime):
+        @classmethod
+        def now(cls, tz=None):
+            return now
+
+    monkeypatch.setattr(impl, "datetime", types.SimpleNamespace(
+        datetime=FixedDateTime, date=datetime.date, timedelta=datetime.timedelta))
+
+    async def main():
+        db = await connect(tmp_path)
+        try:
+            order_id = await db.add_order(new_order(), actions=("update",))
+            task, = await db.claim_due_outbox_tasks(10)
+
+            # 処理中に同じ秒のうちに再登録される
+            await db.update_order(order_id, dict(title="changed"), actions=("update",))
+            assert not await db.complete_outbox_task(task)
+
+            task, = await db.claim_due_outbox_tasks(10)
+            assert task.generation == 1
+            assert await db.complete_outbox_task(task)
+            assert await db.claim_due_outbox_tasks(10) == []
+        finally:
+            await db.close()
+
+    asyncio.run(main())
+
+
+def test_missing_column_is_added_to_existing_table(tmp_path):
+    async def main():
+        db = await connect(tmp_path)
+        async with db._engine.begin() as conn:
+            await conn.execute(text("ALTER TABLE outbox DROP COLUMN generation"))
+            await conn.execute(text("DELETE FROM schema_meta"))
+        await db.close()
+
+        db = await connect(tmp_path)
+        try:
+            async with db._engine.connect() as conn:
+                columns = await conn.run_sync(lambda c: [col["name"] for col in inspect(c).get_columns("outbox")])
+            assert "generation" in columns
+        finally:
+            await db.close()
+
+    asyncio.run(main())
+
+
+async def wait_until(predicate, timeout: float = 5):
+    async def _wait():
+        while not predicate():
+            await asyncio.sleep(0.01)
+    await asyncio.wait_for(_wait(), timeout)
+
+
+def test_failed_task_is_retried_with_backoff(tmp_path):
+    async def main():
+        db = await connect(tmp_path)
+        calls = []
+
+        async def handler(order_id):
+            calls.append(order_id)
+            raise RuntimeError("boom")
+
+        worker = OutboxWorker(db, dict(update=handler), retry_base=30)
+        try:
+            await db.add_order(new_order(), actions=("update",))
+            worker.start()
+            await wait_until(lambda: calls)
+            await wait_until(lambda: not worker._pending)
+            await worker.stop()
+
+            async with db.session() as session:
+                task = (await session.execute(select(OutboxTask))).scalar_one()
+            assert task.attempts == 1 and task.last_error == "boom"
+            assert task.next_attempt > datetime.datetime.now() + datetime.timedelta(seconds=20)
+        finally:
+            await db.close()
+
+    asyncio.run(main())
+
+
+def test_task_re_requested_while_running_runs_again(tmp_path):
+    async def main():
+        db = await connect(tmp_path)
+        calls = []
+        release = asyncio.Event()
+
+        async def handler(order_id):
+            calls.append(order_id)
+            if len(calls) == 1:
+                await release.wait()
+
+        worker = OutboxWorker(db, dict(update=handler))
+        try:
+            order_id = await db.add_order(new_order(), actions=("update",))
+            worker.start()
+            await wait_until(lambda: calls)
+            await db.update_order(order_id, dict(title="changed"), actions=("update",))
+            worker.notify()
+            release.set()
+            await wait_until(lambda: len(calls) == 2)
+            await wait_until(lambda: not worker._pending)
+            assert await db.get_next_outbox_attempt() is None
+        finally:
+            await worker.stop()
+            await db.close()
+
+    asyncio.run(main())
+
+
+def test_stop_releases_unfinished_claims(tmp_path):
+    async def main():
+        db = await connect(tmp_path)
+        started = asyncio.Event()
+
+        async def handler(_):
+            started.set()
+            await asyncio.Event().wait()
+
+        worker = OutboxWorker(db, dict(update=handler))
+        try:
+            await db.add_order(new_order(), actions=("update",))
+            worker.start()
+            await asyncio.wait_for(started.wait(), 5)
+            assert await db.get_next_outbox_attempt() > datetime.datetime.now()
+
+            await worker.stop()
+            # 止めたらすぐ次に取れる
+            assert await db.get_next_outbox_attempt() <= datetime.datetime.now()
+            assert len(await db.claim_due_outbox_tasks(10)) == 1
+        finally:
+            await db.close()
+
+    asyncio.run(main())
@@ -0,0 +1,36 @@
+import asyncio
+import datetime
+import uuid
+import warnings
+
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from utrequestboard.abc import RequestOrder
+from utrequestboard.breaker import BreakerRegistry, CircuitBreaker
+from utrequestboard.database import RequestBoardDatabase
+from utrequestboard.database.option import SQLiteOption
+
+
+def test_broken_replica_falls_back_to_primary(tmp_path):
+    warnings.filterwarnings("ignore")
+
+    async def main():
+        db = RequestBoardDatabase()
+        db.breakers = BreakerRegistry(failure_threshold=2)
+        await db.connect(SQLiteOption(str(tmp_path / "primary.db")))
+        order_id = await db.add_order(RequestOrder(
+            board_id=uuid.uuid4(), created=datetime.datetime.now(), discord_user=1, mcid="", title="title"))
+
+        # 開けないファイルを指すレプリカ
+        db._read_engines = [create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'missing' / 'replica.db'}")]
+        try:
+            for _ in range(3):
+                assert (await db.get_order_record(order_id)).title == "title"
+        finally:
+            await db.close()
+
+        replicas = [b for name, b in db.breakers.breakers.items() if name.startswith("database.replica.")]
+        assert [b.state for b in replicas] == [CircuitBreaker.OPEN]
+        assert db.breakers.get("database").state == CircuitBreaker.CLOSED
+
+    asyncio.run(main())
@@ -0,0 +1,71 @@
+import asyncio
+import time
+
+from utrequestboard.scheduler import DeadlineScheduler
+
+
+def run_scheduler(main, handler=None, **kwargs):
+    async def _run():
+        expired = []
+
+        async def on_expire(key):
+            expired.append((key, time.time()))
+            if handler:
+                await handler(key)
+
+        scheduler = DeadlineScheduler(on_expire, **kwargs)
+        scheduler.start()
+        try:
+            await main(scheduler, expired)
+        finally:
+            await scheduler.stop()
+
+    asyncio.run(_run())
+
+
+def test_expires_in_deadline_order():
+    async def main(scheduler: DeadlineScheduler, expired: list):
+        scheduler.touch("b", 0.1)
+        scheduler.touch("a", 0.05)
+        await asyncio.sleep(0.2)
+        assert [key for key, _ in expired] == ["a", "b"]
+        assert len(scheduler) == 0
+
+    run_scheduler(main)
+
+
+def test_touch_extends_and_cancel_removes():
+    async def main(scheduler: DeadlineScheduler, expired: list):
+        started = time.time()
+        scheduler.touch("a", 0.05)
+        scheduler.touch("a", 0.2)  # 延長
+        scheduler.touch("b", 0.05)
+        scheduler.cancel("b")
+        await asyncio.sleep(0.1)
+        assert expired == [] and "a" in scheduler and "b" not in scheduler
+
+        await asyncio.sleep(0.2)
+        assert [key for key, _ in expired] == ["a"]
+        assert expired[0][1] - started >= 0.2
+
+    run_scheduler(main)
+
+
+def test_failed_handler_is_retried_with_backoff():
+    async def fail(_):
+        raise RuntimeError("boom")
+
+    async def main(scheduler: DeadlineScheduler, expired: list):
+        scheduler.touch("a", 0)
+        await asyncio.sleep(0.25)
+        times = [at for _, at in expired]
+        # 0.05 -> 0.1 -> 0.2 と間隔を空けてやり直す
+        assert len(times) == 3
+        assert times[2] - times[1] > times[1] - times[0] >= 0.05
+        assert "a" in scheduler
+
+        scheduler.cancel("a")
+        await asyncio.sleep(0.3)
+        assert len(expired) == 3
+
+    run_scheduler(main, handler=fail, retry_base=0.05, retry_max=1)
@@ -0,0 +1,66 @@
+import asyncio
+
+import pytest
+
+from utrequestboard.singleflight import SingleFlight
+
+
+def test_concurrent_calls_share_one_execution():
+    async def main():
+        flight = SingleFlight()
+        calls = []
+        release = asyncio.Event()
+
+        async def work():
+            calls.append(None)
+            await release.wait()
+            return len(calls)
+
+        waiters = [asyncio.create_task(flight.do("key", work)) for _ in range(3)]
+        await asyncio.sleep(0)
+        assert "key" in flight
+        release.set()
+        assert await asyncio.gather(*waiters) == [1, 1, 1]
+        assert "key" not in flight
+
+        # 終わった後の呼び出しは新しく実行する
+        assert await flight.do("key", work) == 2
+
+    asyncio.run(main())
+
+
+def test_exception_is_shared_by_all_waiters():
+    async def main():
+        flight = SingleFlight()
+
+        async def fail():
+            await asyncio.sleep(0)
+            raise ValueError("boom")
+
+        results = await asyncio.gather(flight.do("key", fail), flight.do("key", fail), return_exceptions=True)
+        assert [type(r) for r in results] == [ValueError, ValueError]
+        assert results[0] is results[1]
+
+    asyncio.run(main())
+
+
+def test_cancelled_caller_does_not_cancel_shared_work():
+    async def main():
+        flight = SingleFlight()
+        release = asyncio.Event()
+
+        async def work():
+            await release.wait()
+            return "done"
+
+        first = asyncio.create_task(flight.do("key", work))
+        second = asyncio.create_task(flight.do("key", work))
+        await asyncio.sleep(0)
+        first.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await first
+
+        release.set()
+        assert await second == "done"
+
+    asyncio.run(main())
@@ -0,0 +1,45 @@
+import datetime
+import json
+import pickle
+import uuid
+
+from utrequestboard.abc import OrderRecord
+from utrequestboard.journal import encode_order_values, decode_order_values
+from utrequestboard.snapshot import read_snapshot, write_snapshot
+
+
+class Exploit:
+    called = False
+
+    def __reduce__(self):
+        return setattr, (Exploit, "called", True)
+
+
+def test_round_trip_order_records(tmp_path):
+    path = tmp_path / "snapshot.json"
+    record = OrderRecord(
+        id=uuid.uuid4(), board_id=uuid.uuid4(), created=datetime.datetime(2024, 1, 2, 3, 4, 5),
+        discord_user=1, mcid="mcid", title="タイトル", content=None, forum_message=2, forum_message_channel=3,
+        discussion_channel=None, discussion_closed=None,
+    )
+    write_snapshot(path, dict(orders=[encode_order_values(record._asdict())]))
+
+    state = read_snapshot(path, max_age=60)
+    assert [OrderRecord(**decode_order_values(values)) for values in state["orders"]] == [record]
+
+
+def test_pickle_is_not_loaded(tmp_path):
+    path = tmp_path / "snapshot.json"
+    path.write_bytes(b"URBS" + pickle.dumps(Exploit()))
+    assert read_snapshot(path, max_age=60) is None
+    assert not Exploit.called
+
+
+def test_old_or_other_version_is_ignored(tmp_path):
+    path = tmp_path / "snapshot.json"
+    write_snapshot(path, dict(orders=[]))
+    assert read_snapshot(path, max_age=-1) is None
+
+    data = json.loads(path.read_text(encoding="utf-8"))
+    path.write_text(json.dumps(dict(data, version=1)), encoding="utf-8")
+    assert read_snapshot(path, max_age=60) is None
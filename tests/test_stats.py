@@ -0,0 +1,37 @@
+import asyncio
+import datetime
+import uuid
+import warnings
+
+from utrequestboard.abc import RequestOrder
+from utrequestboard.database import RequestBoardDatabase
+from utrequestboard.database.option import SQLiteOption
+
+
+def test_rebuild_matches_incremental_stats(tmp_path):
+    warnings.filterwarnings("ignore")
+    board_id = uuid.uuid4()
+    today = datetime.date.today()
+
+    async def main():
+        db = RequestBoardDatabase()
+        await db.connect(SQLiteOption(str(tmp_path / "test.db")))
+        try:
+            order_ids = []
+            for user in (1, 1, 2):
+                order_ids.append(await db.add_order(RequestOrder(
+                    board_id=board_id, created=datetime.datetime.now(), discord_user=user, mcid="", title="")))
+            await db.update_order(order_ids[0], dict(discussion_channel=100))
+            await db.update_order(order_ids[1], dict(discussion_channel=101))
+            await db.close_orders(order_ids[:1], datetime.datetime.now())
+
+            incremental = await db.get_stats(board_id, today), await db.get_top_requesters(board_id)
+            assert incremental[0][0] == dict(created=3, discussed=2, closed=1, reopened=0)
+            assert incremental[1] == [(1, 2), (2, 1)]
+
+            assert await db.rebuild_stats() == 1
+            assert (await db.get_stats(board_id, today), await db.get_top_requesters(board_id)) == incremental
+        finally:
+            await db.close()
+
+    asyncio.run(main())
@@ -0,0 +1,39 @@
+import time
+import uuid
+
+from utrequestboard import abc
+from utrequestboard.abc import new_order_id, uuid7
+
+
+def test_version_variant_and_timestamp():
+    before = time.time_ns() // 1_000_000
+    value = uuid7()
+    after = time.time_ns() // 1_000_000
+    assert value.version == 7
+    assert value.variant == uuid.RFC_4122
+    assert before <= value.int >> 80 <= after + 1
+    assert new_order_id().version == 7
+
+
+def test_ids_are_strictly_increasing():
+    ids = [uuid7() for _ in range(20000)]
+    assert ids == sorted(ids)
+    assert len(set(ids)) == len(ids)
+    # DB ではバイト列で並ぶので、そちらでも同じ順になる
+    assert [i.bytes for i in ids] == sorted(i.bytes for i in ids)
+
+
+def test_order_is_kept_when_clock_goes_back(monkeypatch):
+    monkeypatch.setattr(abc, "_uuid7_last", [0, 0])
+    first = uuid7()
+    monkeypatch.setattr(abc.time, "time_ns", lambda: ((first.int >> 80) - 1000) * 1_000_000)
+    assert uuid7() > first
+
+
+def test_counter_overflow_moves_to_next_millisecond(monkeypatch):
+    monkeypatch.setattr(abc, "_uuid7_last", [0, 0])
+    now_ms = time.time_ns() // 1_000_000 + 10_000
+    monkeypatch.setattr(abc.time, "time_ns", lambda: now_ms * 1_000_000)
+    ids = [uuid7() for _ in range(0x1000 + 10)]
+    assert ids == sorted(ids)
+    assert ids[-1].int >> 80 == now_ms + 1
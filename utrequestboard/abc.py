@@ -1,17 +1,63 @@
-from sqlalchemy import Column, Uuid, Integer, String, DateTime
+import datetime
+import os
+import threading
+import time
+from typing import NamedTuple
+from uuid import UUID
+
+from sqlalchemy import Column, Uuid, Integer, BigInteger, String, Text, Date, DateTime, Index, UniqueConstraint
 from sqlalchemy.orm import declarative_base
 
 __all__ = [
     "Base",
     "RequestOrder",
+    "OrderRecord",
+    "OutboxTask",
+    "ForumMessageDigest",
+    "RequestBoard",
+    "PooledChannel",
+    "SchemaMeta",
+    "OrderDailyStats",
+    "OrderUserStats",
+    "STAT_KINDS",
     "ReadableError",
+    "uuid7",
+    "new_order_id",
 ]
+STAT_KINDS = ("created", "discussed", "closed", "reopened")
+_uuid7_lock = threading.Lock()
+_uuid7_last = [0, 0]  # [unix_ms, counter]
 
 
 class ReadableError(Exception):
     pass
 
 
+def uuid7() -> UUID:
+    # RFC 9562 UUIDv7: 先頭48ビットがミリ秒のUNIX時刻なので、生成順に並ぶ
+    # 同じミリ秒の間は12ビットのカウンタで順序を保つ
+    with _uuid7_lock:
+        unix_ms = time.time_ns() // 1_000_000
+        last_ms, counter = _uuid7_last
+        if unix_ms <= last_ms:
+            unix_ms = last_ms
+            counter += 1
+            if counter > 0xFFF:
+                unix_ms += 1
+                counter = 0
+        else:
+            counter = int.from_bytes(os.urandom(2), "big") & 0x7FF
+        _uuid7_last[:] = unix_ms, counter
+
+    rand_b = int.from_bytes(os.urandom(8), "big") & ((1 << 62) - 1)
+    return UUID(int=unix_ms << 80 | 0x7 << 76 | counter << 64 | 0b10 << 62 | rand_b)
+
+
+def new_order_id() -> UUID:
+    # 主キーが挿入順に並ぶよう UUIDv7 を使う (既存の UUIDv4 の注文もそのまま使える)
+    return uuid7()
+
+
 Base = declarative_base()
 
 
@@ -33,3 +79,90 @@ class RequestOrder(Base):
     forum_message_channel = Column(Integer, nullable=True)
     discussion_channel = Column(Integer, nullable=True)
     discussion_closed = Column(DateTime(), nullable=True)
+
+
+class OrderRecord(NamedTuple):
+    # 読み取り専用の RequestOrder  (フィールドは orders テーブルの列名と同じ)
+    id: UUID
+    board_id: UUID
+    created: datetime.datetime
+    discord_user: int
+    mcid: str
+    title: str
+    content: str | None
+    forum_message: int | None
+    forum_message_channel: int | None
+    discussion_channel: int | None
+    discussion_closed: datetime.datetime | None
+
+
+class OutboxTask(Base):
+    __tablename__ = "outbox"
+    __table_args__ = (
+        UniqueConstraint("order_id", "action"),
+        {"sqlite_autoincrement": True},
+    )
+
+    id = Column(Integer, nullable=False, primary_key=True, autoincrement=True)
+    order_id = Column(Uuid, nullable=False)
+    action = Column(String(64), nullable=False)
+    requested = Column(DateTime(), nullable=False)
+    # 登録し直すたびに増やす (DATETIME は秒までしか残らない DB があるので、時刻では比べない)
+    generation = Column(Integer, nullable=False, default=0, server_default="0")
+    next_attempt = Column(DateTime(), nullable=False)
+    attempts = Column(Integer, nullable=False, default=0)
+    last_error = Column(String(255), nullable=True)
+
+
+class ForumMessageDigest(Base):
+    # 最後に送った投稿の内容のハッシュ (どのプロセスが編集しても共有する)
+    __tablename__ = "forum_message_digests"
+
+    order_id = Column(Uuid, nullable=False, primary_key=True)
+    digest = Column(String(64), nullable=False)
+
+
+class RequestBoard(Base):
+    __tablename__ = "boards"
+
+    id = Column(Uuid, nullable=False, unique=True, primary_key=True)
+    guild = Column(BigInteger, nullable=False, index=True)
+    data = Column(Text, nullable=False)
+
+
+class PooledChannel(Base):
+    __tablename__ = "channel_pool"
+
+    channel_id = Column(BigInteger, nullable=False, unique=True, primary_key=True)
+    board_id = Column(Uuid, nullable=False, index=True)
+    category_id = Column(BigInteger, nullable=False)
+    created = Column(DateTime(), nullable=False)
+
+
+class SchemaMeta(Base):
+    __tablename__ = "schema_meta"
+
+    name = Column(String(64), nullable=False, primary_key=True)
+    value = Column(String(255), nullable=False)
+
+
+class OrderDailyStats(Base):
+    __tablename__ = "order_stats_daily"
+
+    board_id = Column(Uuid, nullable=False, primary_key=True)
+    day = Column(Date, nullable=False, primary_key=True)
+    created = Column(Integer, nullable=False, default=0)
+    discussed = Column(Integer, nullable=False, default=0)
+    closed = Column(Integer, nullable=False, default=0)
+    reopened = Column(Integer, nullable=False, default=0)
+
+
+class OrderUserStats(Base):
+    __tablename__ = "order_stats_users"
+    __table_args__ = (
+        Index("ix_order_stats_users_board_created", "board_id", "created"),
+    )
+
+    board_id = Column(Uuid, nullable=False, primary_key=True)
+    discord_user = Column(BigInteger, nullable=False, primary_key=True)
+    created = Column(Integer, nullable=False, default=0)
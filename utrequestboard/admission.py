@@ -0,0 +1,110 @@
+import asyncio
+from collections import Counter, deque
+from contextlib import asynccontextmanager
+
+from .abc import ReadableError
+
+__all__ = [
+    "AdmissionRejected",
+    "AdmissionController",
+]
+
+
+class AdmissionRejected(ReadableError):
+    pass
+
+
+class AdmissionController(object):
+    def __init__(
+        self, max_inflight: int = 50, max_inflight_per_guild: int = 10,
+        max_queue: int = 100, queue_timeout: float = 2,
+    ):
+        self.max_inflight = max_inflight
+        self.max_inflight_per_guild = max_inflight_per_guild
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.inflight = 0
+        self.guild_inflight = Counter()  # type: Counter[int | None]
+        self._waiters = deque()  # type: deque[tuple[int | None, asyncio.Future]]
+        # stats
+        self.admitted = 0
+        self.queued = 0
+        self.shed = 0
+        self.shed_by_guild = Counter()  # type: Counter[int | None]
+
+    def configure(self, max_inflight: int, max_inflight_per_guild: int, max_queue: int, queue_timeout: float):
+        self.max_inflight = max_inflight
+        self.max_inflight_per_guild = max_inflight_per_guild
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self._wake_waiters()
+
+    @property
+    def waiting(self):
+        return len(self._waiters)
+
+    def _can_admit(self, guild_id: int | None):
+        return (self.inflight < self.max_inflight
+                and self.guild_inflight[guild_id] < self.max_inflight_per_guild)
+
+    def _acquire(self, guild_id: int | None):
+        self.inflight += 1
+        self.guild_inflight[guild_id] += 1
+        self.admitted += 1
+
+    def _release(self, guild_id: int | None):
+        self.inflight -= 1
+        self.guild_inflight[guild_id] -= 1
+        if self.guild_inflight[guild_id] <= 0:
+            del self.guild_inflight[guild_id]
+        self._wake_waiters()
+
+    def _wake_waiters(self):
+        # 他のサーバーの待機を塞がないよう、入れるものから順に入れる
+        for waiter in list(self._waiters):
+            guild_id, fut = waiter
+            if fut.done():
+                self._waiters.remove(waiter)
+            elif self._can_admit(guild_id):
+                self._waiters.remove(waiter)
+                self._acquire(guild_id)
+                fut.set_result(None)
+            elif self.inflight >= self.max_inflight:
+                break
+
+    def _reject(self, guild_id: int | None):
+        self.shed += 1
+        self.shed_by_guild[guild_id] += 1
+        raise AdmissionRejected("混雑しています。しばらくしてから再度お試しください")
+
+    @asynccontextmanager
+    async def admit(self, guild_id: int | None):
+        # 待機中のものは枠が空いた時点で入れているので、残っているのは入れないサーバーのものだけ
+        if self._can_admit(guild_id):
+            self._acquire(guild_id)
+
+        else:
+            if len(self._waiters) >= self.max_queue:
+                self._reject(guild_id)
+
+            fut = asyncio.get_running_loop().create_future()
+            self._waiters.append((guild_id, fut))
+            self.queued += 1
+            try:
+                await asyncio.wait_for(asyncio.shield(fut), self.queue_timeout)
+            except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+                if not fut.done():
+                    fut.cancel()
+                    self._waiters = deque(w for w in self._waiters if w[1] is not fut)
+                    if isinstance(e, asyncio.CancelledError):
+                        raise
+                    self._reject(guild_id)
+                elif isinstance(e, asyncio.CancelledError):
+                    # 枠を得た直後にキャンセルされた
+                    self._release(guild_id)
+                    raise
+
+        try:
+            yield
+        finally:
+            self._release(guild_id)
@@ -0,0 +1,134 @@
+import asyncio
+import time
+from logging import getLogger
+from typing import Awaitable, Callable, TypeVar
+
+from .abc import ReadableError
+
+log = getLogger(__name__)
+__all__ = [
+    "CircuitOpenError",
+    "OperationTimeoutError",
+    "CircuitBreaker",
+    "BreakerRegistry",
+]
+T = TypeVar("T")
+
+
+class CircuitOpenError(ReadableError):
+    pass
+
+
+class OperationTimeoutError(ReadableError):
+    pass
+
+
+class CircuitBreaker(object):
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, name: str, failure_threshold: int = 5, reset_timeout: float = 30):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.total_calls = 0
+        self.total_failures = 0
+        self.total_rejected = 0
+        self._trial = False
+
+    def allow(self) -> bool:
+        if self.state == self.OPEN:
+            if time.monotonic() - self.opened_at < self.reset_timeout:
+                self.total_rejected += 1
+                return False
+            self.state = self.HALF_OPEN
+            self._trial = False
+
+        if self.state == self.HALF_OPEN:
+            # 復旧確認のため１つだけ通す
+            if self._trial:
+                self.total_rejected += 1
+                return False
+            self._trial = True
+
+        self.total_calls += 1
+        return True
+
+    def cancel_trial(self):
+        self._trial = False
+
+    def record_success(self):
+        if self.state != self.CLOSED:
+            log.info("Circuit '%s' closed", self.name)
+        self.state = self.CLOSED
+        self.failures = 0
+        self._trial = False
+
+    def record_failure(self):
+        self.failures += 1
+        self.total_failures += 1
+        if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+            if self.state != self.OPEN:
+                log.warning("Circuit '%s' opened after %s failures", self.name, self.failures)
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
+            self._trial = False
+
+
+class BreakerRegistry(object):
+    def __init__(
+        self, *, failure_threshold: int = 5, reset_timeout: float = 30,
+        default_timeout: float | None = 10, timeouts: dict[str, float | None] = None,
+        is_failure: Callable[[BaseException], bool] = None,
+    ):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.default_timeout = default_timeout
+        self.timeouts = timeouts or {}
+        self.is_failure = is_failure or (lambda _: True)
+        self.breakers = {}  # type: dict[str, CircuitBreaker]
+
+    def get(self, name: str) -> CircuitBreaker:
+        if not (breaker := self.breakers.get(name)):
+            breaker = self.breakers[name] = CircuitBreaker(name, self.failure_threshold, self.reset_timeout)
+        return breaker
+
+    def get_timeout(self, name: str) -> float | None:
+        # "discord.fetch_channel" -> "discord.fetch_channel", "discord" の順に探す
+        while True:
+            if name in self.timeouts:
+                return self.timeouts[name]
+            if "." not in name:
+                return self.default_timeout
+            name = name.rsplit(".", 1)[0]
+
+    async def call(self, name: str, aw: Awaitable[T], *, timeout: float | None = None) -> T:
+        breaker = self.get(name)
+        if not breaker.allow():
+            if asyncio.iscoroutine(aw):
+                aw.close()
+            raise CircuitOpenError("外部サービスが不安定なため処理を停止しています。しばらくしてから再度お試しください")
+
+        try:
+            result = await asyncio.wait_for(aw, timeout or self.get_timeout(name))
+        except asyncio.TimeoutError:
+            breaker.record_failure()
+            log.warning("Timed out operation: %s", name)
+            raise OperationTimeoutError("応答がありませんでした。しばらくしてから再度お試しください")
+        except Exception as e:
+            if self.is_failure(e):
+                breaker.record_failure()
+            else:
+                breaker.record_success()
+            raise
+        except BaseException:
+            # キャンセルなどは判定に含めない
+            breaker.cancel_trial()
+            raise
+
+        breaker.record_success()
+        return result
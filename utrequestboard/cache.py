@@ -0,0 +1,104 @@
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable
+from uuid import UUID
+
+import discord
+
+from .abc import OrderRecord
+
+__all__ = [
+    "MemberCache",
+    "OrderRecordCache",
+]
+
+
+class MemberCache(object):
+    def __init__(self, max_size: int = 1000, ttl: float = 600, negative_ttl: float = 60):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self._entries = OrderedDict()  # type: OrderedDict[tuple[int, int], tuple[float, discord.Member | None]]
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _set(self, key: tuple[int, int], member: discord.Member | None):
+        expires = time.monotonic() + (self.ttl if member else self.negative_ttl)
+        self._entries[key] = (expires, member)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def put(self, member: discord.Member):
+        self._set((member.guild.id, member.id), member)
+
+    def invalidate(self, guild_id: int, user_id: int):
+        self._entries.pop((guild_id, user_id), None)
+
+    def clear(self):
+        self._entries.clear()
+
+    async def get(
+        self, guild: discord.Guild, user_id: int,
+        fetch: Callable[[discord.Guild, int], Awaitable[discord.Member]] = None,
+    ) -> discord.Member | None:
+        key = (guild.id, user_id)
+        if entry := self._entries.get(key):
+            expires, member = entry
+            if expires > time.monotonic():
+                self._entries.move_to_end(key)
+                return member
+            del self._entries[key]
+
+        if not (member := guild.get_member(user_id)):
+            try:
+                member = await (fetch(guild, user_id) if fetch else guild.fetch_member(user_id))
+            except discord.NotFound:
+                member = None  # サーバーにいない
+
+        self._set(key, member)
+        return member
+
+
+class OrderRecordCache(object):
+    def __init__(self, max_size: int = 5000, ttl: float = 60):
+        self.max_size = max_size
+        self.ttl = ttl
+        # forum_message -> (expires, record, verified)
+        self._entries = OrderedDict()  # type: OrderedDict[int, tuple[float, OrderRecord, bool]]
+        self._message_ids = {}  # type: dict[UUID, int]
+
+    def __len__(self):
+        return len(self._entries)
+
+    def put(self, record: OrderRecord, verified: bool = True):
+        if record.forum_message is None:
+            return
+        self._entries[record.forum_message] = (time.monotonic() + self.ttl, record, verified)
+        self._entries.move_to_end(record.forum_message)
+        self._message_ids[record.id] = record.forum_message
+        while len(self._entries) > self.max_size:
+            _, (_, old, _) = self._entries.popitem(last=False)
+            self._message_ids.pop(old.id, None)
+
+    def get(self, forum_message_id: int) -> tuple[OrderRecord, bool] | None:
+        if not (entry := self._entries.get(forum_message_id)):
+            return None
+        expires, record, verified = entry
+        if expires <= time.monotonic():
+            self.invalidate(record.id)
+            return None
+        self._entries.move_to_end(forum_message_id)
+        return record, verified
+
+    def invalidate(self, order_id: UUID):
+        if (message_id := self._message_ids.pop(order_id, None)) is not None:
+            self._entries.pop(message_id, None)
+
+    def clear(self):
+        self._entries.clear()
+        self._message_ids.clear()
+
+    def records(self) -> list[OrderRecord]:
+        return [record for _, record, _ in self._entries.values()]
@@ -1,3 +1,4 @@
+import json
 import uuid
 from typing import Iterable
 from uuid import UUID
@@ -28,40 +29,201 @@ class Board(ConfigValues):
     panel_format: Embed | None = None
     new_request_button_id: str | None = None
     discussion_channel_category: ChannelId | None
+    # 上限に達したときに自動で追加されたカテゴリ
+    discussion_channel_overflow_categories: list[int]
+    # 議論チャンネルを自動で閉じるまでの無操作時間 (分)
+    discussion_idle_timeout: int | None = None
+    # 運営向けのまとめ通知を送るチャンネル
+    digest_channel: ChannelId | None = None
 
     @classmethod
     def _serializers(cls) -> Iterable[ObjectSerializer]:
         return [UUIDSerializer()]
 
 
+def serialize_board(board: Board) -> str:
+    panel_message = board.panel_message
+    forum_channel = board.forum_channel
+    category = board.discussion_channel_category
+    return json.dumps(dict(
+        id=board.id.hex,
+        guild=board.guild,
+        panel_message=[panel_message.id, panel_message.channel_id] if panel_message is not None else None,
+        forum_channel=forum_channel.id if forum_channel is not None else None,
+        panel_format=board.panel_format.to_dict() if board.panel_format else None,
+        new_request_button_id=board.new_request_button_id,
+        discussion_channel_category=getattr(category, "id", category),
+        discussion_channel_overflow_categories=list(board.discussion_channel_overflow_categories),
+        discussion_idle_timeout=board.discussion_idle_timeout,
+        digest_channel=board.digest_channel.id if board.digest_channel else None,
+    ), ensure_ascii=False)
+
+
+def deserialize_board(value: str) -> Board:
+    data = json.loads(value)
+    board = Board()
+    board.id = uuid.UUID(data["id"])
+    board.guild = data["guild"]
+    if panel_message := data.get("panel_message"):
+        board.panel_message = MessageId(message_id=panel_message[0], channel_id=panel_message[1])
+    if forum_channel := data.get("forum_channel"):
+        board.forum_channel = ChannelId(forum_channel)
+    if panel_format := data.get("panel_format"):
+        board.panel_format = Embed.from_dict(panel_format)
+    board.new_request_button_id = data.get("new_request_button_id")
+    if category := data.get("discussion_channel_category"):
+        board.discussion_channel_category = ChannelId(category)
+    board.discussion_channel_overflow_categories = list(data.get("discussion_channel_overflow_categories") or [])
+    board.discussion_idle_timeout = data.get("discussion_idle_timeout")
+    if digest_channel := data.get("digest_channel"):
+        board.digest_channel = ChannelId(digest_channel)
+    return board
+
+
 class SQLiteConfig(ConfigValues):
     path: str = "database.db"
 
 
+class MySQLReplicaConfig(ConfigValues):
+    host: str = "localhost"
+    port: int = 3306
+
+
 class MySQLConfig(ConfigValues):
     host: str = "localhost"
     port: int = 3306
     database: str = "utrequestboard"
     username: str = "root"
     password: str = "abcdefg"
+    # 読み取り専用のレプリカ  同じユーザー名とパスワードで接続します
+    replicas: list[MySQLReplicaConfig]
+    # 書き込み後、同じ処理内でプライマリから読み取る時間 (秒)
+    replica_sticky_seconds: float = 5
 
 
 class DatabaseSection(ConfigValues):
     # タイプ: sqlite, mysql
     type: str = "sqlite"
+    # 複数プロセスで動かす場合の排他制御: auto, local, file (sqlite), mysql
+    lock: str = "auto"
 
     sqlite: SQLiteConfig
     mysql: MySQLConfig
 
 
+class OutboxConfig(ConfigValues):
+    # 同時に処理する数
+    concurrency: int = 2
+    # 失敗時の再試行間隔 (秒)  失敗するごとに倍になります
+    retry_base_seconds: int = 5
+    retry_max_seconds: int = 600
+    # 再試行を諦めるまでの回数
+    max_attempts: int = 10
+
+
+class MemberCacheConfig(ConfigValues):
+    # 保持するメンバーの最大数
+    size: int = 1000
+    # 保持する時間 (秒)
+    ttl_seconds: int = 600
+    # サーバーにいないユーザーを保持する時間 (秒)
+    negative_ttl_seconds: int = 60
+
+
+class TimeoutConfig(ConfigValues):
+    # 応答を待つ時間 (秒)
+    discord: float = 10
+    database: float = 10
+    # 操作ごとの待つ時間 (秒)  例: discord.create_text_channel: 20
+    operations: dict[str, float]
+    # 連続で失敗すると、一時的に呼び出しを止めます
+    failure_threshold: int = 5
+    # 止めてから再び試すまでの時間 (秒)
+    reset_seconds: int = 30
+
+
+class AdmissionConfig(ConfigValues):
+    # 同時に処理するボタン操作の数
+    max_inflight: int = 50
+    # サーバーごとに同時に処理する数
+    max_inflight_per_guild: int = 10
+    # 処理を待てる数  超えた操作には混雑中と応答します
+    max_queue: int = 100
+    # 処理を待つ時間 (秒)
+    queue_timeout_seconds: float = 2
+
+
+class TracingConfig(ConfigValues):
+    # ボタン操作ごとの処理時間を記録する (traces.jsonl)
+    enabled: bool = False
+    # 記録する処理時間 (ミリ秒)
+    threshold_ms: float = 500
+    # ファイルサイズの上限と、残す古いファイルの数
+    max_file_bytes: int = 5 * 1024 * 1024
+    backup_count: int = 3
+
+
+class DigestConfig(ConfigValues):
+    # まとめ通知を送る間隔 (秒)
+    interval_seconds: int = 300
+    # この件数が溜まったら間隔を待たずに送る
+    batch_size: int = 20
+
+
+class JournalConfig(ConfigValues):
+    # DBに接続できない間の書き込みを journal.jsonl に記録し、復旧後に反映する
+    # 反映を試みる間隔 (秒)
+    replay_interval_seconds: int = 10
+    # 同時に届いた書き込みをまとめて fsync するまでの待ち時間 (ミリ秒)
+    fsync_batch_ms: float = 5
+
+
+class OrderCacheConfig(ConfigValues):
+    # ボタン操作時に参照するリクエストのキャッシュ
+    size: int = 5000
+    ttl_seconds: float = 60
+
+
+class SnapshotConfig(ConfigValues):
+    # 停止時にキャッシュなどを snapshot.json に保存し、次の起動時に読み込む
+    enabled: bool = True
+    # これより古いスナップショットは使わない (秒)
+    max_age_seconds: int = 3600
+
+
 class RequestBoardConfig(FileConfigValues):
-    # 設定されたボード
-    # 追加や登録はコマンドから行ってください
+    # 旧バージョンで設定されたボード
+    # 起動時にデータベースへ移行されます。追加や登録はコマンドから行ってください
     boards: list[Board]
     # 再度作成できるようになるまでの時間 (分)
     create_cool_times: int | None = None
+    # ボードごとに事前に作成しておく議論チャンネルの数 (0 で無効)
+    discussion_channel_pool_size: int = 0
+    # まとめて閉じるときなどに同時に行う Discord の操作の数
+    bulk_concurrency: int = 4
     # パネルの内容
     panel_format = Embed("作成ボタンからリクエストを送信できます", title="リクエストの送信")
 
+    # 設定ファイルの変更を確認する間隔 (秒)  変更されると自動で再読み込みします
+    watch_config_interval: int | None = None
+
     # データベース設定
     database: DatabaseSection
+    # フォーラム投稿の更新などの遅延処理
+    outbox: OutboxConfig
+    # リクエストユーザーのキャッシュ
+    member_cache: MemberCacheConfig
+    # 外部サービスの応答待ちと、障害時の呼び出し停止
+    timeouts: TimeoutConfig
+    # 混雑時の受付制限
+    admission: AdmissionConfig
+    # 遅い処理の調査用
+    tracing: TracingConfig
+    # 運営向けのまとめ通知 (送信先はボードごとに設定)
+    digest: DigestConfig
+    # DB障害時の書き込みの記録
+    journal: JournalConfig
+    # リクエストのキャッシュ
+    order_cache: OrderCacheConfig
+    # 再起動時の状態の引き継ぎ
+    snapshot: SnapshotConfig
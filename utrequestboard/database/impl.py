@@ -1,13 +1,24 @@
 import asyncio
-import uuid
-from contextlib import asynccontextmanager
+import datetime
+import functools
+import hashlib
+import itertools
+import time
+from collections import Counter
+from contextlib import asynccontextmanager, nullcontext
+from contextvars import ContextVar
 from logging import getLogger
+from typing import Awaitable, Callable, Iterable, TypeVar
 from uuid import UUID
 
-from sqlalchemy import delete, select
-from sqlalchemy.exc import NoResultFound
+from sqlalchemy import Connection, Table, delete, inspect, select, func, text, update
+from sqlalchemy.exc import DBAPIError, NoResultFound
+from sqlalchemy.schema import CreateColumn, CreateIndex, CreateTable
 from sqlalchemy.ext.asyncio import AsyncConnection, AsyncSession, async_sessionmaker, AsyncEngine, create_async_engine
 
+from ..breaker import BreakerRegistry, CircuitOpenError
+from ..tracing import Tracer
+from .lock import LockBackend, LocalLock, create_lock_backend
 from .option import DatabaseOption
 from ..abc import *
 
@@ -15,29 +26,175 @@ __all__ = [
     "RequestBoardDatabase",
 ]
 log = getLogger(__name__)
+T = TypeVar("T")
+_last_write = ContextVar("utrequestboard_last_write", default=0.0)
+_order_record_columns = [RequestOrder.__table__.c[name] for name in OrderRecord._fields]
+_schema_digest = None  # type: str | None
+
+
+def get_schema_digest() -> str:
+    # モデルの DDL から求めるので、テーブルやカラムを変えると自動で変わる
+    global _schema_digest
+    if _schema_digest is None:
+        ddl = []
+        for table in Base.metadata.sorted_tables:
+            ddl.append(str(CreateTable(table)))
+            ddl.extend(sorted(str(CreateIndex(index)) for index in table.indexes))
+        _schema_digest = hashlib.sha1("\n".join(ddl).encode("utf-8")).hexdigest()
+    return _schema_digest
+
+
+def get_state_counts(before: tuple[int | None, datetime.datetime | None], order: RequestOrder) -> dict[str, int]:
+    channel, closed = before
+    counts = {}
+    if channel is None and order.discussion_channel is not None:
+        counts["discussed"] = 1
+    if closed is None and order.discussion_closed is not None:
+        counts["closed"] = 1
+    elif closed is not None and order.discussion_closed is None:
+        counts["reopened"] = 1
+    return counts
+
+
+def _guarded(func):
+    @functools.wraps(func)
+    async def wrapper(self: "RequestBoardDatabase", *args, **kwargs):
+        return await self._call(func(self, *args, **kwargs), func.__name__)
+    return wrapper
+
+
+def _guarded_write(lock: str | Callable[..., str]):
+    # ロックの順番待ちは待ち時間や失敗に含めないよう、取ってから計る
+    # ロックは呼び出し元のタスクで取り、直前の書き込みの時刻を呼び出し元に残す
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(self: "RequestBoardDatabase", *args, **kwargs):
+            async with self.write_lock(lock(*args, **kwargs) if callable(lock) else lock):
+                return await self._call(func(self, *args, **kwargs), func.__name__.lstrip("_"))
+        return wrapper
+    return decorator
+
+
+def _order_lock(order: RequestOrder | UUID, *_, **__) -> str:
+    return f"order:{(order.id if isinstance(order, RequestOrder) else order).hex}"
+
+
+def _guarded_read(func):
+    # 読み取り専用の処理。接続は呼び出すたびに、レプリカかプライマリのものを渡す
+    @functools.wraps(func)
+    async def wrapper(self: "RequestBoardDatabase", *args, primary: bool = False, **kwargs):
+        return await self._read(lambda conn: func(self, conn, *args, **kwargs), func.__name__, primary)
+    return wrapper
+
+
+def get_replica_breaker_name(engine: AsyncEngine) -> str:
+    # レプリカごとに分け、１台の不調でプライマリへの書き込みまで止めないようにする
+    url = engine.url
+    return f"database.replica.{url.host or url.database}" + (f":{url.port}" if url.port else "")
 
 
 class RequestBoardDatabase(object):
     def __init__(self):
         self._engine = None  # type: AsyncEngine | None
+        self._read_engines = []  # type: list[AsyncEngine]
+        self._read_counter = itertools.count()
+        self._sticky_seconds = 0.0
         self._lock = asyncio.Lock()
+        self._lock_backend = LocalLock()  # type: LockBackend
+        self.breakers = None  # type: BreakerRegistry | None
+        self.tracer = None  # type: Tracer | None
+        self.connect_timings = {}  # type: dict[str, float]
+
+    def _create_engine(self, url) -> AsyncEngine:
+        engine = create_async_engine(url, echo=False)
+        if self.tracer:
+            self.tracer.install(engine)
+        return engine
 
-    async def connect(self, db_option: DatabaseOption):
+    async def connect(self, db_option: DatabaseOption, lock_mode: str = "auto"):
         if self._engine:
             raise RuntimeError("Current engine not closed")
 
+        self._lock_backend = create_lock_backend(lock_mode, db_option, lambda: self._engine)
+
         log.debug("Creating database engine")
-        self._engine = create_async_engine(db_option.create_url(), echo=False)
+        started = time.perf_counter()
+        self._engine = self._create_engine(db_option.create_url())
+        self._read_engines = [self._create_engine(url) for url in db_option.create_replica_urls()]
+        engine_created = time.perf_counter()
+        await self._prepare_schema(self._engine)
+        self.connect_timings = dict(
+            engine=(engine_created - started) * 1000,
+            schema=(time.perf_counter() - engine_created) * 1000,
+        )
+        self._sticky_seconds = db_option.sticky_seconds
+        log.debug("Connected database (replicas: %s)", len(self._read_engines))
+
+    async def swap(self, db_option: DatabaseOption, lock_mode: str = "auto"):
+        log.debug("Creating new database engine")
+        lock_backend = create_lock_backend(lock_mode, db_option, lambda: self._engine)
+        engine = self._create_engine(db_option.create_url())
+        try:
+            await self._prepare_schema(engine)
+        except Exception:
+            await engine.dispose()
+            raise
+        read_engines = [self._create_engine(url) for url in db_option.create_replica_urls()]
+
+        # 処理中の書き込みを待ってから切り替える
+        async with self._lock:
+            old_engines = [self._engine, *self._read_engines]
+            self._engine = engine
+            self._read_engines = read_engines
+            self._sticky_seconds = db_option.sticky_seconds
+            self._lock_backend = lock_backend
+
+        for old_engine in old_engines:
+            if old_engine is not None:
+                await old_engine.dispose()
+        log.debug("Swapped database engine")
+
+    @staticmethod
+    async def _prepare_schema(engine: AsyncEngine):
+        digest = get_schema_digest()
+        try:
+            async with engine.connect() as conn:  # type: AsyncConnection
+                result = await conn.execute(select(SchemaMeta.value).where(SchemaMeta.name == "schema_digest"))
+                current = result.scalar()
+        except DBAPIError:
+            current = None  # まだテーブルがない
 
-        async with self._engine.begin() as conn:  # type: AsyncConnection
+        if current == digest:
+            log.debug("Database schema is up to date")
+            return
+
+        log.info("Creating database schema")
+        async with engine.begin() as conn:  # type: AsyncConnection
             await conn.run_sync(Base.metadata.create_all)
+            await conn.run_sync(RequestBoardDatabase._add_missing_columns)
+            await conn.execute(delete(SchemaMeta).where(SchemaMeta.name == "schema_digest"))
+            await conn.execute(SchemaMeta.__table__.insert().values(name="schema_digest", value=digest))
 
-        log.debug("Connected database")
+    @staticmethod
+    def _add_missing_columns(conn: Connection):
+        # create_all は既存のテーブルに列を足さないので、足りない列だけ追加する
+        inspector = inspect(conn)
+        for table in Base.metadata.sorted_tables:
+            existing = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+                table_name = conn.dialect.identifier_preparer.format_table(table)
+                conn.execute(text(f"ALTER TABLE {table_name} ADD COLUMN {CreateColumn(column).compile(conn)}"))
+                log.info("Added column %s.%s", table.name, column.name)
 
     async def close(self):
         if self._engine is None:
             return
 
+        for engine in self._read_engines:
+            await engine.dispose()
+        self._read_engines = []
         await self._engine.dispose()
         self._engine = None
         log.debug("Closed database")
@@ -45,53 +202,399 @@ class RequestBoardDatabase(object):
     def session(self) -> AsyncSession:
         return async_sessionmaker(autoflush=True, bind=self._engine)()
 
-    #
+    def read_engine(self, primary: bool = False) -> AsyncEngine:
+        # 直前に書き込んだ流れでは、レプリカの遅延を避けるためプライマリから読む
+        if (primary or not self._read_engines
+                or time.monotonic() - _last_write.get() < self._sticky_seconds):
+            return self._engine
+        return self._read_engines[next(self._read_counter) % len(self._read_engines)]
 
-    async def get_order(self, order: UUID) -> RequestOrder | None:
-        async with self.session() as db:
-            result = await db.execute(select(RequestOrder).where(RequestOrder.id == order))
-            try:
-                return result.one()[0]
-            except NoResultFound:
-                return None
+    async def _call(self, aw, name: str = None, breaker: str = "database"):
+        with self.tracer.span("db." + name) if self.tracer and name else nullcontext():
+            if self.breakers is None:
+                return await aw
+            return await self.breakers.call(breaker, aw)
 
-    async def get_order_by_forum_message_id(self, forum_message_id: int) -> RequestOrder | None:
-        async with self.session() as db:
-            result = await db.execute(select(RequestOrder).where(RequestOrder.forum_message == forum_message_id))
+    async def _read(self, read: Callable[[AsyncConnection], Awaitable[T]], name: str, primary: bool = False) -> T:
+        if (engine := self.read_engine(primary)) is not self._engine:
             try:
-                return result.one()[0]
-            except NoResultFound:
-                return None
+                return await self._call(self._read_with(engine, read), name, get_replica_breaker_name(engine))
+            except CircuitOpenError:
+                pass  # 不調なレプリカは復旧するまでプライマリで読む
+            except Exception as e:
+                log.warning("Failed to read from replica (%s), retrying on primary: %s", engine.url.host, e)
+        return await self._call(self._read_with(self._engine, read), name)
+
+    @staticmethod
+    async def _read_with(engine: AsyncEngine, read: Callable[[AsyncConnection], Awaitable[T]]) -> T:
+        async with engine.connect() as conn:
+            return await read(conn)
+
+    @asynccontextmanager
+    async def write_lock(self, name: str = "global"):
+        # プロセス内は従来どおり直列にし、プロセス間はバックエンドで排他する
+        try:
+            async with self._lock:
+                async with self._lock_backend.lock(name):
+                    yield
+        finally:
+            _last_write.set(time.monotonic())
+
+    # ORM を通さない読み取り専用の取得
 
-    async def add_order(self, order: RequestOrder):
+    @_guarded_read
+    async def get_order_record(self, conn: AsyncConnection, order: UUID) -> OrderRecord | None:
+        result = await conn.execute(select(*_order_record_columns).where(RequestOrder.id == order))
+        return OrderRecord._make(row) if (row := result.first()) else None
+
+    @_guarded_read
+    async def get_order_record_by_forum_message_id(
+        self, conn: AsyncConnection, forum_message_id: int,
+    ) -> OrderRecord | None:
+        result = await conn.execute(
+            select(*_order_record_columns).where(RequestOrder.forum_message == forum_message_id))
+        return OrderRecord._make(row) if (row := result.first()) else None
+
+    @_guarded_read
+    async def get_open_discussion_orders(
+        self, conn: AsyncConnection, board_id: UUID | None = None,
+    ) -> list[OrderRecord]:
+        query = select(*_order_record_columns).where(
+            RequestOrder.discussion_channel.is_not(None),
+            RequestOrder.discussion_closed.is_(None),
+        )
+        if board_id is not None:
+            query = query.where(RequestOrder.board_id == board_id)
+
+        result = await conn.execute(query)
+        return [OrderRecord._make(row) for row in result]
+
+    async def add_order(self, order: RequestOrder, actions: Iterable[str] = ()):
         if order.id is None:
-            order.id = uuid.uuid4()
-        order_id = order.id
-        async with self._lock:
-            async with self.session() as db:
-                db.add(order)
-                await db.commit()
-        return order_id
+            order.id = new_order_id()
+        return await self._add_order(order, actions)
+
+    @_guarded_write(_order_lock)
+    async def _add_order(self, order: RequestOrder, actions: Iterable[str] = ()):
+        async with self.session() as db:
+            # 呼び出し元が追加後も order を参照できるようにする
+            db.sync_session.expire_on_commit = False
+            db.add(order)
+            await self._enqueue_outbox(db, order.id, actions)
+            await self._bump_stats(
+                db, order.board_id, order.created.date(), dict(created=1), user=order.discord_user)
+            await db.commit()
+        return order.id
 
+    @_guarded_write(_order_lock)
     async def remove_order(self, order: RequestOrder | UUID):
-        async with self._lock:
-            async with self.session() as db:
-                if isinstance(order, RequestOrder):
-                    await db.delete(order)
-                else:
-                    await db.execute(delete(RequestOrder).where(RequestOrder.id == order))
-                await db.commit()
+        order_id = order.id if isinstance(order, RequestOrder) else order
+        async with self.session() as db:
+            if isinstance(order, RequestOrder):
+                await db.delete(order)
+            else:
+                await db.execute(delete(RequestOrder).where(RequestOrder.id == order))
+            await db.execute(delete(ForumMessageDigest).where(ForumMessageDigest.order_id == order_id))
+            await db.commit()
 
     @asynccontextmanager
-    async def modify_order(self, order: UUID):
-        async with self._lock:
+    async def modify_order(self, order: UUID, actions: Iterable[str] = ()):
+        async with self.write_lock(f"order:{order.hex}"):
             async with self.session() as db:
-                result = await db.execute(select(RequestOrder).where(RequestOrder.id == order))
+                result = await self._call(
+                    db.execute(select(RequestOrder).where(RequestOrder.id == order).with_for_update()))
                 try:
                     order = result.one()[0]
                 except NoResultFound:
                     raise
 
+                before = order.discussion_channel, order.discussion_closed
                 yield order
                 db.add(order)
+                await self._enqueue_outbox(db, order.id, actions)
+                await self._bump_stats(db, order.board_id, datetime.date.today(), get_state_counts(before, order))
+                await self._call(db.commit())
+
+    @_guarded_write("orders:bulk")
+    async def close_orders(
+        self, orders: Iterable[UUID], closed: datetime.datetime, actions: Iterable[str] = (),
+    ) -> list[UUID]:
+        # まとめて閉じる。すでに閉じられていたものは除く
+        if not (order_ids := list(orders)):
+            return []
+        actions = tuple(actions)
+
+        async with self.session() as db:
+            result = await db.execute(select(RequestOrder).where(
+                RequestOrder.id.in_(order_ids),
+                RequestOrder.discussion_closed.is_(None),
+            ).with_for_update())
+            closed_orders = list(result.scalars())
+
+            closed_ids = []
+            per_board = Counter()  # type: Counter[UUID]
+            for order in closed_orders:
+                order.discussion_closed = closed
+                await self._enqueue_outbox(db, order.id, actions)
+                closed_ids.append(order.id)
+                per_board[order.board_id] += 1
+            for board_id, count in per_board.items():
+                await self._bump_stats(db, board_id, closed.date(), dict(closed=count))
+            await db.commit()
+            return closed_ids
+
+    async def update_order(self, order: UUID, values: dict, actions: Iterable[str] = ()):
+        async with self.modify_order(order, actions=actions) as _order:
+            for key, value in values.items():
+                setattr(_order, key, value)
+
+    @_guarded
+    async def get_forum_message_digest(self, order: UUID) -> str | None:
+        # 他のプロセスが編集した直後でも正しく比べられるよう、プライマリから読む
+        async with self._engine.connect() as conn:
+            result = await conn.execute(select(ForumMessageDigest.digest).where(ForumMessageDigest.order_id == order))
+            return result.scalar()
+
+    @_guarded_write(_order_lock)
+    async def set_forum_message_digest(self, order: UUID, digest: str | None):
+        async with self.session() as db:
+            await db.execute(delete(ForumMessageDigest).where(ForumMessageDigest.order_id == order))
+            if digest is not None:
+                db.add(ForumMessageDigest(order_id=order, digest=digest))
+            await db.commit()
+
+    # stats
+
+    def _upsert_increment(self, table: Table, keys: dict, counts: dict[str, int]):
+        counters = [column.name for column in table.c if not column.primary_key]
+        values = dict(keys, **{name: counts.get(name, 0) for name in counters})
+        dialect = self._engine.dialect.name
+        if dialect == "sqlite":
+            from sqlalchemy.dialects.sqlite import insert
+            stmt = insert(table).values(values)
+            return stmt.on_conflict_do_update(
+                index_elements=list(keys), set_={name: table.c[name] + stmt.excluded[name] for name in counts})
+        elif dialect == "mysql":
+            from sqlalchemy.dialects.mysql import insert
+            stmt = insert(table).values(values)
+            return stmt.on_duplicate_key_update({name: table.c[name] + stmt.inserted[name] for name in counts})
+        raise NotImplementedError(f"Unsupported dialect: {dialect}")
+
+    async def _bump_stats(
+        self, db: AsyncSession, board_id: UUID, day: datetime.date, counts: dict[str, int], user: int = None,
+    ):
+        if not counts:
+            return
+        await db.execute(self._upsert_increment(
+            OrderDailyStats.__table__, dict(board_id=board_id, day=day), counts))
+        if user is not None and counts.get("created"):
+            await db.execute(self._upsert_increment(
+                OrderUserStats.__table__, dict(board_id=board_id, discord_user=user), dict(created=counts["created"])))
+
+    @_guarded_read
+    async def get_stats(
+        self, conn: AsyncConnection, board_id: UUID, since: datetime.date,
+    ) -> tuple[dict[str, int], dict[str, int]]:
+        columns = [func.coalesce(func.sum(OrderDailyStats.__table__.c[kind]), 0) for kind in STAT_KINDS]
+        query = select(*columns).where(OrderDailyStats.board_id == board_id)
+        total = (await conn.execute(query)).one()
+        recent = (await conn.execute(query.where(OrderDailyStats.day >= since))).one()
+        return dict(zip(STAT_KINDS, total)), dict(zip(STAT_KINDS, recent))
+
+    @_guarded_read
+    async def get_top_requesters(self, conn: AsyncConnection, board_id: UUID, limit: int = 5) -> list[tuple[int, int]]:
+        query = (select(OrderUserStats.discord_user, OrderUserStats.created)
+                 .where(OrderUserStats.board_id == board_id)
+                 .order_by(OrderUserStats.created.desc())
+                 .limit(limit))
+        return [tuple(row) for row in await conn.execute(query)]
+
+    async def rebuild_stats(self) -> int:
+        # 全件を集計し直すので、通常の待ち時間や失敗の判定とは分ける
+        async with self.write_lock("stats"):
+            return await self._call(self._rebuild_stats(), "rebuild_stats", "database.rebuild_stats")
+
+    async def _rebuild_stats(self) -> int:
+        # 議論の開始・再開の日時は残っていないため、開始は作成日で数え、再開は数えない
+        daily = {}  # type: dict[tuple[UUID, datetime.date], dict[str, int]]
+        created_day = func.date(RequestOrder.created)
+        closed_day = func.date(RequestOrder.discussion_closed)
+        queries = dict(
+            created=select(RequestOrder.board_id, created_day, func.count())
+            .group_by(RequestOrder.board_id, created_day),
+            discussed=select(RequestOrder.board_id, created_day, func.count())
+            .where(RequestOrder.discussion_channel.is_not(None))
+            .group_by(RequestOrder.board_id, created_day),
+            closed=select(RequestOrder.board_id, closed_day, func.count())
+            .where(RequestOrder.discussion_closed.is_not(None))
+            .group_by(RequestOrder.board_id, closed_day),
+        )
+
+        # 他のプロセスの注文の書き込みは別名のロックなので "stats" では止まらない
+        # 先に集計表を消して行を押さえ、注文は共有ロックを取って読み、同じトランザクションで書き直す
+        # (数え直しと書き込みの間に、注文と集計の増分が入り込まないようにする)
+        async with self.session() as db:
+            await db.execute(delete(OrderDailyStats))
+            await db.execute(delete(OrderUserStats))
+
+            for kind, query in queries.items():
+                for board_id, day, count in await db.execute(query.with_for_update(read=True)):
+                    if isinstance(day, str):
+                        day = datetime.date.fromisoformat(day)  # SQLite
+                    daily.setdefault((board_id, day), dict.fromkeys(STAT_KINDS, 0))[kind] = count
+
+            users = await db.execute(
+                select(RequestOrder.board_id, RequestOrder.discord_user, func.count())
+                .group_by(RequestOrder.board_id, RequestOrder.discord_user)
+                .with_for_update(read=True))
+            users = [dict(board_id=b, discord_user=u, created=c) for b, u, c in users]
+
+            if daily:
+                await db.execute(OrderDailyStats.__table__.insert(), [
+                    dict(board_id=board_id, day=day, **counts) for (board_id, day), counts in daily.items()])
+            if users:
+                await db.execute(OrderUserStats.__table__.insert(), users)
+            await db.commit()
+        return len(daily)
+
+    # boards
+
+    @_guarded
+    async def get_boards(self) -> list[RequestBoard]:
+        async with self.session() as db:
+            result = await db.execute(select(RequestBoard))
+            return list(result.scalars())
+
+    @_guarded_write("boards")
+    async def save_board(self, board_id: UUID, guild: int, data: str):
+        async with self.session() as db:
+            await db.merge(RequestBoard(id=board_id, guild=guild, data=data))
+            await db.commit()
+
+    @_guarded_write("boards")
+    async def remove_board(self, board_id: UUID):
+        async with self.session() as db:
+            await db.execute(delete(RequestBoard).where(RequestBoard.id == board_id))
+            await db.commit()
+
+    # channel pool
+
+    @_guarded_write("pool")
+    async def add_pooled_channel(self, channel_id: int, board_id: UUID, category_id: int):
+        async with self.session() as db:
+            db.add(PooledChannel(
+                channel_id=channel_id, board_id=board_id, category_id=category_id,
+                created=datetime.datetime.now(),
+            ))
+            await db.commit()
+
+    @_guarded_write("pool")
+    async def take_pooled_channel(self, board_id: UUID) -> PooledChannel | None:
+        async with self.session() as db:
+            result = await db.execute(
+                select(PooledChannel)
+                .where(PooledChannel.board_id == board_id)
+                .order_by(PooledChannel.created)
+                .limit(1)
+                .with_for_update()
+            )
+            if channel := result.scalar_one_or_none():
+                await db.delete(channel)
                 await db.commit()
+            return channel
+
+    @_guarded
+    async def count_pooled_channels(self, board_id: UUID) -> int:
+        async with self.session() as db:
+            result = await db.execute(
+                select(func.count()).select_from(PooledChannel).where(PooledChannel.board_id == board_id))
+            return result.scalar()
+
+    # outbox
+
+    @staticmethod
+    async def _enqueue_outbox(db: AsyncSession, order_id: UUID, actions: Iterable[str]):
+        now = datetime.datetime.now()
+        for action in actions:
+            result = await db.execute(select(OutboxTask).where(
+                OutboxTask.order_id == order_id,
+                OutboxTask.action == action,
+            ))
+            if task := result.scalar_one_or_none():
+                # 未処理の同じ処理があればまとめる
+                task.requested = now
+                task.generation = OutboxTask.generation + 1
+                task.next_attempt = now
+                task.attempts = 0
+            else:
+                db.add(OutboxTask(
+                    order_id=order_id, action=action, requested=now, next_attempt=now, attempts=0,
+                ))
+
+    @_guarded_write("outbox")
+    async def claim_due_outbox_tasks(
+        self, limit: int, lease: float = 300, exclude: set[tuple[UUID, str]] = frozenset(),
+    ) -> list[OutboxTask]:
+        now = datetime.datetime.now()
+        async with self.session() as db:
+            result = await db.execute(
+                select(OutboxTask)
+                .where(OutboxTask.next_attempt <= now)
+                .order_by(OutboxTask.next_attempt)
+                .limit(limit)
+                .with_for_update()
+            )
+            # 実行中に再登録されたものは、終わるまで取らない (取ると延ばした時刻まで放置される)
+            tasks = [task for task in result.scalars() if (task.order_id, task.action) not in exclude]
+            # 他のプロセスが同じ処理を取らないよう、処理中は次の実行時刻を先に延ばしておく
+            for task in tasks:
+                task.next_attempt = now + datetime.timedelta(seconds=lease)
+            await db.commit()
+            for task in tasks:
+                await db.refresh(task)
+            return tasks
+
+    @_guarded
+    async def get_next_outbox_attempt(self) -> datetime.datetime | None:
+        async with self.session() as db:
+            result = await db.execute(select(func.min(OutboxTask.next_attempt)))
+            return result.scalar()
+
+    @_guarded_write("outbox")
+    async def complete_outbox_task(self, task: OutboxTask) -> bool:
+        async with self.session() as db:
+            result = await db.execute(delete(OutboxTask).where(
+                OutboxTask.id == task.id,
+                OutboxTask.generation == task.generation,
+            ))
+            if completed := bool(result.rowcount):
+                await db.commit()
+                return completed
+
+            # 処理中に再登録されていれば残し、すぐに実行し直す
+            result = await db.execute(select(OutboxTask).where(OutboxTask.id == task.id))
+            if _task := result.scalar_one_or_none():
+                _task.next_attempt = datetime.datetime.now()
+            await db.commit()
+            return completed
+
+    @_guarded_write("outbox")
+    async def release_outbox_tasks(self, tasks: list[OutboxTask]):
+        now = datetime.datetime.now()
+        async with self.session() as db:
+            await db.execute(update(OutboxTask).where(
+                OutboxTask.id.in_([task.id for task in tasks]),
+                OutboxTask.next_attempt > now,
+            ).values(next_attempt=now))
+            await db.commit()
+
+    @_guarded_write("outbox")
+    async def retry_outbox_task(self, task: OutboxTask, next_attempt: datetime.datetime, error: str):
+        async with self.session() as db:
+            result = await db.execute(select(OutboxTask).where(OutboxTask.id == task.id))
+            if not (_task := result.scalar_one_or_none()) or _task.generation != task.generation:
+                return
+            _task.attempts = task.attempts + 1
+            _task.next_attempt = next_attempt
+            _task.last_error = error[:255]
+            await db.commit()
@@ -0,0 +1,126 @@
+import asyncio
+import hashlib
+import os
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Callable
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from .option import DatabaseOption, SQLiteOption, MySQLOption
+
+__all__ = [
+    "LockBackend",
+    "LocalLock",
+    "FileLock",
+    "MySQLAdvisoryLock",
+    "create_lock_backend",
+]
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+
+class LockBackend(object):
+    def lock(self, name: str) -> AsyncIterator[None]:
+        raise NotImplementedError
+
+
+class LocalLock(LockBackend):
+    @asynccontextmanager
+    async def lock(self, name: str):
+        yield
+
+
+class FileLock(LockBackend):
+    def __init__(self, path: str, poll_interval: float = 0.02, timeout: float = 30):
+        self.path = path
+        self.poll_interval = poll_interval
+        self.timeout = timeout
+
+    @staticmethod
+    def _try_lock(fd: int) -> bool:
+        try:
+            if fcntl:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            else:
+                msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+        except OSError:
+            return False
+        return True
+
+    @staticmethod
+    def _unlock(fd: int):
+        if fcntl:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+        else:
+            os.lseek(fd, 0, os.SEEK_SET)
+            msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+
+    @asynccontextmanager
+    async def lock(self, name: str):
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT)
+        try:
+            loop = asyncio.get_running_loop()
+            deadline = loop.time() + self.timeout
+            # ブロックするとイベントループが止まるため、取れるまで待機を繰り返す
+            while not self._try_lock(fd):
+                if loop.time() > deadline:
+                    raise TimeoutError(f"Could not acquire file lock: {self.path}")
+                await asyncio.sleep(self.poll_interval)
+
+            try:
+                yield
+            finally:
+                self._unlock(fd)
+        finally:
+            os.close(fd)
+
+
+class MySQLAdvisoryLock(LockBackend):
+    def __init__(self, engine: Callable[[], AsyncEngine], prefix: str, timeout: int = 30):
+        self.engine = engine
+        self.prefix = prefix
+        self.timeout = timeout
+
+    def key(self, name: str) -> str:
+        # GET_LOCK の名前は 64 文字まで。切り詰めると別のロックと重なるので、ハッシュにして収める
+        return "utrb:" + hashlib.sha1((self.prefix + name).encode("utf-8")).hexdigest()
+
+    @asynccontextmanager
+    async def lock(self, name: str):
+        key = self.key(name)
+        # 名前付きロックは接続に紐づくため、専用の接続で保持する
+        async with self.engine().connect() as conn:
+            result = await conn.execute(text("SELECT GET_LOCK(:name, :timeout)"), dict(name=key, timeout=self.timeout))
+            if result.scalar() != 1:
+                raise TimeoutError(f"Could not acquire lock: {key}")
+            try:
+                yield
+            finally:
+                await conn.execute(text("SELECT RELEASE_LOCK(:name)"), dict(name=key))
+
+
+def create_lock_backend(mode: str, db_option: DatabaseOption, engine: Callable[[], AsyncEngine]) -> LockBackend:
+    if mode == "auto":
+        if isinstance(db_option, MySQLOption):
+            mode = "mysql"
+        elif isinstance(db_option, SQLiteOption):
+            mode = "file"
+        else:
+            mode = "local"
+
+    if mode == "local":
+        return LocalLock()
+    elif mode == "file":
+        if not isinstance(db_option, SQLiteOption):
+            raise ValueError("file lock requires sqlite database")
+        return FileLock(db_option.file_path + ".lock")
+    elif mode == "mysql":
+        if not isinstance(db_option, MySQLOption):
+            raise ValueError("mysql lock requires mysql database")
+        return MySQLAdvisoryLock(engine, f"{db_option.database}:")
+    raise ValueError(f"Unknown lock mode: {mode}")
@@ -9,9 +9,14 @@ __all__ = [
 
 
 class DatabaseOption:
+    sticky_seconds: float = 0
+
     def create_url(self) -> URL:
         raise NotImplementedError
 
+    def create_replica_urls(self) -> list[URL]:
+        return []
+
 
 @dataclass
 class SQLiteOption(DatabaseOption):
@@ -34,14 +39,19 @@ class MySQLOption(DatabaseOption):
     username: str
     password: str
     query: dict = field(default_factory=lambda: dict(charset="utf8mb4"))
+    replicas: list[tuple[str, int]] = field(default_factory=list)
+    sticky_seconds: float = 5
 
-    def create_url(self) -> URL:
+    def create_url(self, host: str = None, port: int = None) -> URL:
         return URL.create(
             drivername="mysql+aiomysql",
-            host=self.host,
-            port=self.port,
+            host=host or self.host,
+            port=port or self.port,
             database=self.database,
             username=self.username,
             password=self.password,
             query=self.query,
         )
+
+    def create_replica_urls(self) -> list[URL]:
+        return [self.create_url(host, port) for host, port in self.replicas]
@@ -0,0 +1,77 @@
+import asyncio
+import datetime
+from collections import defaultdict
+from logging import getLogger
+from typing import Awaitable, Callable, NamedTuple
+from uuid import UUID
+
+log = getLogger(__name__)
+__all__ = [
+    "DigestEvent",
+    "StaffDigest",
+]
+
+
+class DigestEvent(NamedTuple):
+    kind: str  # new, opened, closed, reopened
+    order_id: UUID
+    title: str
+    mcid: str
+    discord_user: int
+    forum_thread: int | None
+    time: datetime.datetime
+
+
+class StaffDigest(object):
+    def __init__(
+        self, send: Callable[[UUID, list[DigestEvent]], Awaitable[None]],
+        interval: float = 300, batch_size: int = 20,
+    ):
+        self._send = send
+        self.interval = interval
+        self.batch_size = batch_size
+        self._events = defaultdict(list)  # type: defaultdict[UUID, list[DigestEvent]]
+        self._task = None  # type: asyncio.Task | None
+        self._flushing = set()  # type: set[asyncio.Task]
+        self.sent = 0
+
+    def __len__(self):
+        return sum(map(len, self._events.values()))
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    def add(self, board_id: UUID, event: DigestEvent):
+        events = self._events[board_id]
+        events.append(event)
+        if len(events) >= self.batch_size:
+            task = asyncio.create_task(self.flush(board_id))
+            self._flushing.add(task)
+            task.add_done_callback(self._flushing.discard)
+
+    async def flush(self, board_id: UUID = None):
+        board_ids = [board_id] if board_id is not None else list(self._events)
+        for board_id in board_ids:
+            if not (events := self._events.pop(board_id, None)):
+                continue
+            try:
+                await self._send(board_id, events)
+                self.sent += 1
+            except Exception as e:
+                log.warning("Failed to send staff digest (board %s, %s events): %s", board_id, len(events), e)
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            await self.flush()
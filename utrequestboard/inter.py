@@ -1,3 +1,4 @@
+from contextlib import nullcontext
 from logging import getLogger
 from typing import Callable, Awaitable, NamedTuple
 
@@ -7,6 +8,7 @@ from discord._types import ClientT
 
 from dncore.abc.serializables import Embed
 from .abc import ReadableError
+from .admission import AdmissionController, AdmissionRejected
 
 log = getLogger(__name__)
 __all__ = [
@@ -31,7 +33,16 @@ async def handle_error(error: BaseException, res: discord.InteractionResponse):
         log.warning(f"Failed to send response", exc_info=e)
 
 
-def create_new_request_view(id: str, on_click: Callable[[discord.InteractionResponse], Awaitable[None]]):
+def admit(admission: AdmissionController | None, inter: discord.Interaction):
+    if admission is None:
+        return nullcontext()
+    return admission.admit(inter.guild_id)
+
+
+def create_new_request_view(
+    id: str, on_click: Callable[[discord.Interaction, discord.InteractionResponse], Awaitable[None]],
+    admission: AdmissionController = None,
+):
     custom_id = custom_id_new_request_prefix + id
 
     class NewRequestView(discord.ui.View):
@@ -40,7 +51,10 @@ def create_new_request_view(id: str, on_click: Callable[[discord.InteractionResp
             # noinspection PyTypeChecker
             res: discord.InteractionResponse = inter.response
             try:
-                await on_click(res)
+                async with admit(admission, inter):
+                    await on_click(inter, res)
+            except AdmissionRejected as e:
+                await handle_error(e, res)
             except Exception as e:
                 log.exception("Exception in handling button new_request", exc_info=e)
                 await handle_error(e, res)
@@ -50,6 +64,7 @@ def create_new_request_view(id: str, on_click: Callable[[discord.InteractionResp
 
 def create_single_button_view(
     button_id: str, label: str, on_click: Callable[[discord.Interaction, discord.InteractionResponse], Awaitable[None]],
+    admission: AdmissionController = None,
 ):
 
     class CreateDiscussionChannelView(discord.ui.View):
@@ -58,7 +73,10 @@ def create_single_button_view(
             # noinspection PyTypeChecker
             res: discord.InteractionResponse = inter.response
             try:
-                await on_click(inter, res)
+                async with admit(admission, inter):
+                    await on_click(inter, res)
+            except AdmissionRejected as e:
+                await handle_error(e, res)
             except Exception as e:
                 log.exception("Exception in handling button %s", button_id, exc_info=e)
                 await handle_error(e, res)
@@ -74,6 +92,7 @@ class RequestValues(NamedTuple):
 
 def create_request_modal(
     on_submit_: Callable[[discord.Interaction, discord.InteractionResponse, RequestValues], Awaitable[None]],
+    admission: AdmissionController = None,
 ):
     class RequestModal(discord.ui.Modal, title="内容を入力してください"):
         input_mcid = discord.ui.TextInput(label="MCID", required=True)
@@ -84,11 +103,14 @@ def create_request_modal(
             # noinspection PyTypeChecker
             res: discord.InteractionResponse = inter.response
             try:
-                await on_submit_(inter, res, RequestValues(
-                    self.input_mcid.value,
-                    self.input_title.value,
-                    self.input_content.value
-                ))
+                async with admit(admission, inter):
+                    await on_submit_(inter, res, RequestValues(
+                        self.input_mcid.value,
+                        self.input_title.value,
+                        self.input_content.value
+                    ))
+            except AdmissionRejected as e:
+                await handle_error(e, res)
             except Exception as e:
                 log.exception("Exception in handling submit request", exc_info=e)
                 await handle_error(e, res)
@@ -0,0 +1,162 @@
+import asyncio
+import datetime
+import json
+import os
+from logging import getLogger
+from pathlib import Path
+from uuid import UUID
+
+from .abc import RequestOrder, OrderRecord
+
+log = getLogger(__name__)
+__all__ = [
+    "OrderJournal",
+    "encode_order_values",
+    "decode_order_values",
+]
+_uuid_columns = {"id", "board_id"}
+_datetime_columns = {"created", "discussion_closed"}
+
+
+def encode_order_values(values: dict) -> dict:
+    data = {}
+    for key, value in values.items():
+        if isinstance(value, UUID):
+            value = str(value)
+        elif isinstance(value, datetime.datetime):
+            value = value.isoformat()
+        data[key] = value
+    return data
+
+
+def decode_order_values(data: dict) -> dict:
+    values = {}
+    for key, value in data.items():
+        if value is not None:
+            if key in _uuid_columns:
+                value = UUID(value)
+            elif key in _datetime_columns:
+                value = datetime.datetime.fromisoformat(value)
+        values[key] = value
+    return values
+
+
+def get_order_values(order: RequestOrder) -> dict:
+    return {name: getattr(order, name) for name in OrderRecord._fields}
+
+
+# DBに書き込めない間の注文の追加・変更を記録する追記専用のファイル
+# 同時に追加されたエントリはまとめて書き込み、fsync は１回で済ませる
+class OrderJournal(object):
+    def __init__(self, path: Path, batch_delay: float = 0.005):
+        self.path = path
+        self.batch_delay = batch_delay
+        self._entries = []  # type: list[tuple[dict, str]]
+        self._pending = []  # type: list[tuple[dict, str, asyncio.Future]]
+        self._flusher = None  # type: asyncio.Task | None
+        self._lock = asyncio.Lock()
+        self.appended = 0
+        self.fsyncs = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def load(self):
+        self._entries.clear()
+        try:
+            lines = self.path.read_text(encoding="utf-8").splitlines()
+        except FileNotFoundError:
+            return
+
+        for index, line in enumerate(lines):
+            if not line.strip():
+                continue
+            try:
+                self._entries.append((json.loads(line), line))
+            except ValueError:
+                # 書き込み途中で止まった最後の行は捨てる
+                log.warning("Ignored broken journal entry at line %s", index + 1)
+
+        if self._entries:
+            log.info("Loaded %s journal entries", len(self._entries))
+
+    def entries(self) -> list[dict]:
+        # 書き込みが終わっていないものは含めない
+        pending = {id(entry) for entry, _, _ in self._pending}
+        return [entry for entry, _ in self._entries if id(entry) not in pending]
+
+    # write
+
+    async def append_order(self, order: RequestOrder, actions: tuple[str, ...] = ()):
+        await self.append(dict(
+            op="add_order", order=encode_order_values(get_order_values(order)), actions=list(actions)))
+
+    async def append_update(self, order_id: UUID, values: dict, actions: tuple[str, ...] = ()):
+        await self.append(dict(
+            op="update_order", order_id=str(order_id), values=encode_order_values(values), actions=list(actions)))
+
+    async def append(self, entry: dict):
+        entry = dict(entry, time=datetime.datetime.now().isoformat())
+        line = json.dumps(entry, ensure_ascii=False)
+        fut = asyncio.get_running_loop().create_future()
+        self._entries.append((entry, line))
+        self._pending.append((entry, line, fut))
+        if self._flusher is None or self._flusher.done():
+            self._flusher = asyncio.create_task(self._flush_loop())
+        await asyncio.shield(fut)
+
+    async def _flush_loop(self):
+        while self._pending:
+            if self.batch_delay:
+                await asyncio.sleep(self.batch_delay)
+            async with self._lock:
+                await self._flush_pending()
+
+    async def _flush_pending(self):
+        pending, self._pending = self._pending, []
+        if not pending:
+            return
+
+        try:
+            await asyncio.to_thread(self._write, [line for _, line, _ in pending])
+        except Exception as e:
+            log.error("Failed to write journal: %s", e)
+            failed = {id(entry) for entry, _, _ in pending}
+            self._entries = [e for e in self._entries if id(e[0]) not in failed]
+            for _, _, fut in pending:
+                if not fut.done():
+                    fut.set_exception(e)
+            return
+
+        self.appended += len(pending)
+        self.fsyncs += 1
+        for _, _, fut in pending:
+            if not fut.done():
+                fut.set_result(None)
+
+    def _write(self, lines: list[str]):
+        with self.path.open("a", encoding="utf-8") as file:
+            file.write("".join(line + "\n" for line in lines))
+            file.flush()
+            os.fsync(file.fileno())
+
+    # replay
+
+    async def discard(self, count: int):
+        # 先頭から count 件を反映済みとして取り除く
+        async with self._lock:
+            await self._flush_pending()
+            del self._entries[:count]
+            await asyncio.to_thread(self._rewrite, [line for _, line in self._entries])
+
+    def _rewrite(self, lines: list[str]):
+        if not lines:
+            self.path.unlink(missing_ok=True)
+            return
+
+        tmp_path = self.path.with_name(self.path.name + ".tmp")
+        with tmp_path.open("w", encoding="utf-8") as file:
+            file.write("".join(line + "\n" for line in lines))
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(tmp_path, self.path)
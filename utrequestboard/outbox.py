@@ -0,0 +1,137 @@
+import asyncio
+import datetime
+import random
+from logging import getLogger
+from typing import Awaitable, Callable
+from uuid import UUID
+
+from .abc import OutboxTask
+from .database import RequestBoardDatabase
+
+log = getLogger(__name__)
+__all__ = [
+    "OutboxWorker",
+]
+
+
+class OutboxWorker(object):
+    def __init__(
+        self, db: RequestBoardDatabase, handlers: dict[str, Callable[[UUID], Awaitable[None]]],
+        *, concurrency: int = 2, retry_base: float = 5, retry_max: float = 600, max_attempts: int = 10,
+        poll_interval: float = 60,
+    ):
+        self.db = db
+        self.handlers = handlers
+        self.concurrency = max(1, concurrency)
+        self.retry_base = retry_base
+        self.retry_max = retry_max
+        self.max_attempts = max_attempts
+        self.poll_interval = poll_interval
+        self._queue = asyncio.Queue(maxsize=self.concurrency * 2)  # type: asyncio.Queue[OutboxTask]
+        self._pending = {}  # type: dict[tuple[UUID, str], OutboxTask]
+        self._wakeup = asyncio.Event()
+        self._tasks = []  # type: list[asyncio.Task]
+
+    @property
+    def running(self):
+        return bool(self._tasks)
+
+    def start(self):
+        if self._tasks:
+            return
+        self._tasks.append(asyncio.create_task(self._dispatch()))
+        for _ in range(self.concurrency):
+            self._tasks.append(asyncio.create_task(self._work()))
+
+    async def stop(self):
+        tasks, self._tasks = self._tasks, []
+        unfinished = list(self._pending.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._queue = asyncio.Queue(maxsize=self.concurrency * 2)
+        self._pending.clear()
+
+        # 取ったまま終えていないものは、再開後や他のプロセスがすぐ取れるよう期限を戻す
+        if unfinished:
+            try:
+                await self.db.release_outbox_tasks(unfinished)
+            except Exception as e:
+                log.warning("Failed to release %s outbox tasks: %s", len(unfinished), e)
+
+    def notify(self):
+        self._wakeup.set()
+
+    async def _dispatch(self):
+        while True:
+            self._wakeup.clear()
+            timeout = self.poll_interval
+            try:
+                tasks = await self.db.claim_due_outbox_tasks(limit=self.concurrency * 4, exclude=set(self._pending))
+                for task in tasks:
+                    if (key := (task.order_id, task.action)) in self._pending:
+                        continue
+                    self._pending[key] = task
+                    await self._queue.put(task)
+
+                if next_attempt := await self.db.get_next_outbox_attempt():
+                    delay = (next_attempt - datetime.datetime.now()).total_seconds()
+                    timeout = min(timeout, max(1.0, delay))
+
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                log.warning("Failed to load outbox tasks: %s", e)
+
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _work(self):
+        while True:
+            task = await self._queue.get()
+            try:
+                await self._process(task)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                log.exception("Exception in outbox worker", exc_info=e)
+            finally:
+                self._pending.pop((task.order_id, task.action), None)
+                self._queue.task_done()
+
+    async def _process(self, task: OutboxTask):
+        if not (handler := self.handlers.get(task.action)):
+            log.warning("Unknown outbox action: %s (%s)", task.action, task.order_id)
+            await self.complete(task)
+            return
+
+        try:
+            await handler(task.order_id)
+
+        except asyncio.CancelledError:
+            raise
+
+        except Exception as e:
+            attempts = task.attempts + 1
+            if attempts >= self.max_attempts:
+                log.error("Gave up outbox task %s (%s) after %s attempts: %s",
+                          task.action, task.order_id, attempts, e)
+                await self.complete(task)
+                return
+
+            delay = min(self.retry_max, self.retry_base * 2 ** task.attempts)
+            delay *= random.uniform(0.8, 1.2)
+            log.warning("Failed outbox task %s (%s), retry in %ds: %s", task.action, task.order_id, delay, e)
+            await self.db.retry_outbox_task(
+                task, datetime.datetime.now() + datetime.timedelta(seconds=delay), str(e) or type(e).__name__,
+            )
+            self.notify()
+
+        else:
+            await self.complete(task)
+
+    async def complete(self, task: OutboxTask):
+        if not await self.db.complete_outbox_task(task):
+            self.notify()  # 処理中に再登録された
@@ -1,10 +1,18 @@
 import asyncio
 import datetime
+import hashlib
+import json
+import math
+import threading
+import time
 import uuid
+from collections import OrderedDict, Counter
 from logging import getLogger
+from typing import Awaitable, Callable, TypeVar
 from uuid import UUID
 
 import discord.channel
+from sqlalchemy.exc import DBAPIError, InterfaceError, OperationalError
 
 from dncore import DNCoreAPI
 from dncore.abc.serializables import Embed, MessageId, ChannelId
@@ -14,15 +22,35 @@ from dncore.discord.events import ReadyEvent
 from dncore.event import onevent
 from dncore.plugin import Plugin
 from .abc import *
-from .config import RequestBoardConfig, Board
+from .admission import AdmissionController
+from .breaker import BreakerRegistry, CircuitBreaker, CircuitOpenError, OperationTimeoutError
+from .cache import MemberCache, OrderRecordCache
+from .digest import DigestEvent, StaffDigest
+from .config import RequestBoardConfig, Board, serialize_board, deserialize_board
 from .database import RequestBoardDatabase
 from .database.option import SQLiteOption, MySQLOption
 from .inter import *
+from .journal import OrderJournal, encode_order_values, decode_order_values
+from .outbox import OutboxWorker
+from .scheduler import DeadlineScheduler
+from .singleflight import SingleFlight
+from .snapshot import read_snapshot, write_snapshot
+from .tracing import Tracer, SamplingProfiler, PhaseTimer
 
 log = getLogger(__name__)
-
-
-def create_request_form_embed(order: RequestOrder):
+T = TypeVar("T")
+ACTION_UPDATE_FORUM_MESSAGE = "update_forum_message"
+ACTION_SEND_DISCUSSION_MESSAGE = "send_discussion_message"
+DIGEST_EVENT_LABELS = {
+    "new": "新規リクエスト",
+    "opened": "議論開始",
+    "closed": "クローズ",
+    "reopened": "再開",
+}
+DISCUSSION_CATEGORY_LIMIT = 50  # Discord のカテゴリ内のチャンネル数の上限
+
+
+def create_request_form_embed(order: RequestOrder | OrderRecord):
     em = Embed.info(title=order.title, content=None)
     if order.content:
         em.description = "**詳細内容**\n> " + "\n> ".join(order.content.split("\n"))
@@ -33,6 +61,12 @@ def create_request_form_embed(order: RequestOrder):
     return em
 
 
+def get_forum_message_digest(em: discord.Embed, view: discord.ui.View) -> str:
+    custom_ids = [item.custom_id for item in view.children if isinstance(item, discord.ui.Button)]
+    data = json.dumps([em.to_dict(), custom_ids], sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha1(data.encode("utf-8")).hexdigest()
+
+
 def get_discussion_user_permission():
     return discord.PermissionOverwrite(
         view_channel=True,
@@ -45,7 +79,33 @@ def get_me_permission():
     )
 
 
-async def send_discussion_channel_new_message(channel: discord.TextChannel, order: RequestOrder):
+def is_dependency_failure(error: BaseException):
+    if isinstance(error, discord.HTTPException):
+        # 404 や権限不足などはサービスの異常ではない
+        return error.status >= 500 or error.status == 429
+    return not isinstance(error, ReadableError)
+
+
+def is_database_unavailable(error: BaseException):
+    if isinstance(error, (CircuitOpenError, OperationTimeoutError, ConnectionError)):
+        return True
+    if isinstance(error, DBAPIError):
+        return error.connection_invalidated or isinstance(error, (OperationalError, InterfaceError))
+    return False
+
+
+async def send_cooldown_message(res: discord.InteractionResponse, remaining: float):
+    try:
+        await res.send_message(
+            embed=Embed.warn(f":hourglass: あと {math.ceil(remaining / 60)} 分ほどで再度作成できます"),
+            ephemeral=True,
+            delete_after=6,
+        )
+    except (Exception,):
+        pass
+
+
+async def send_discussion_channel_new_message(channel: discord.TextChannel, order: OrderRecord):
     await channel.send(
         content=f"<@{order.discord_user}>",
         embed=Embed.info("運営により議論チャンネルが作成されました"),
@@ -55,65 +115,364 @@ async def send_discussion_channel_new_message(channel: discord.TextChannel, orde
 class RequestBoardPlugin(Plugin):
     def __init__(self):
         self.use_intents = discord.Intents.guilds
-        self.config = RequestBoardConfig(self.data_dir / "config.yml")
+        self.config_path = self.data_dir / "config.yml"
+        self.config = RequestBoardConfig(self.config_path)
         self.db = RequestBoardDatabase()
+        self.boards = []  # type: list[Board]
         self._init_discord_ok = False
+        self._board_views = {}  # type: dict[str, discord.ui.View]
+        self._config_watcher = None  # type: asyncio.Task | None
+        self.idle_scheduler = DeadlineScheduler(self.on_discussion_idle)
+        self.outbox = None  # type: OutboxWorker | None
+        self.single_flight = SingleFlight()
+        self.member_cache = MemberCache()
+        self.order_cache = OrderRecordCache()
+        self._cooldowns = {}  # type: dict[tuple[UUID, int], float]
+        self.snapshot_path = self.data_dir / "snapshot.json"
+        self.breakers = BreakerRegistry()
+        self.admission = AdmissionController()
+        self.tracer = Tracer()
+        self.db.tracer = self.tracer
+        self._loop_thread_id = None  # type: int | None
+        self._rendered_embeds = OrderedDict()  # type: OrderedDict[OrderRecord, Embed]
+        self._category_locks = {}  # type: dict[UUID, asyncio.Lock]
+        self._category_pending = Counter()  # type: Counter[int]
+        self._category_recent_channels = {}  # type: dict[int, dict[int, float]]
+        self._pool_refilling = set()  # type: set[UUID]
+        self.pool_hits = 0
+        self.pool_misses = 0
+        self.digest = StaffDigest(self.send_staff_digest)
+        self.journal = OrderJournal(self.data_dir / "journal.jsonl")
+        self._journal_replayer = None  # type: asyncio.Task | None
         #
         self.discussion_create_channel_view = self.create_discussion_channel_view()
         self.discussion_close_channel_view = self.create_discussion_close_channel_view()
         self.discussion_reopen_channel_view = self.create_discussion_reopen_channel_view()
 
     async def on_enable(self):
-        self.config.load()
+        timer = PhaseTimer()
+        with timer.phase("config"):
+            self.config.load()
+        conf = self.config.member_cache
+        self.member_cache = MemberCache(conf.size, conf.ttl_seconds, conf.negative_ttl_seconds)
+        conf = self.config.order_cache
+        self.order_cache = OrderRecordCache(conf.size, conf.ttl_seconds)
+        self.init_breakers()
+        self.init_admission()
+        self.init_tracer()
+        self.init_digest()
+        self._loop_thread_id = threading.get_ident()
         await self.init_database()
+        for name, duration in self.db.connect_timings.items():
+            timer.add(name, duration)
+        with timer.phase("boards"):
+            await self.load_boards()
+        with timer.phase("snapshot"):
+            self.load_snapshot()
+        with timer.phase("journal"):
+            self.init_journal()
 
         if not self._init_discord_ok and ((client := DNCoreAPI.client()) and client.is_ready()):
             await self._init_discord()
 
+        self.start_config_watcher()
+        log.info("Enabled in %.1fms (%s)", timer.total, timer.format())
+
     async def on_disable(self):
+        if self._config_watcher:
+            self._config_watcher.cancel()
+            self._config_watcher = None
+        await self.idle_scheduler.stop()
+        await self.digest.stop()
+        if self._journal_replayer:
+            self._journal_replayer.cancel()
+            self._journal_replayer = None
+        if self.outbox:
+            await self.outbox.stop()
+            self.outbox = None
+        self.save_snapshot()
         await self.close_database()
+        self._init_discord_ok = False
 
     @onevent(monitor=True)
     async def on_ready(self, _: ReadyEvent):
         if not self._init_discord_ok:
             await self._init_discord()
 
-    async def init_database(self):
-        if self.config.database.type == "mysql":
-            conf = self.config.database.mysql
-            await self.db.connect(MySQLOption(
+    def init_breakers(self):
+        conf = self.config.timeouts
+        self.breakers = BreakerRegistry(
+            failure_threshold=conf.failure_threshold,
+            reset_timeout=conf.reset_seconds,
+            default_timeout=conf.discord,
+            # 統計の作り直しは全件を読むので、指定がなければ待ち時間を設けない
+            timeouts={"database.rebuild_stats": None, **conf.operations, "database": conf.database},
+            is_failure=is_dependency_failure,
+        )
+        self.db.breakers = self.breakers
+
+    def init_admission(self):
+        conf = self.config.admission
+        self.admission.configure(
+            conf.max_inflight, conf.max_inflight_per_guild, conf.max_queue, conf.queue_timeout_seconds)
+
+    def init_tracer(self):
+        conf = self.config.tracing
+        self.tracer.configure(
+            conf.enabled, conf.threshold_ms, self.data_dir / "traces.jsonl", conf.max_file_bytes, conf.backup_count)
+
+    def init_digest(self):
+        self.digest.interval = self.config.digest.interval_seconds
+        self.digest.batch_size = self.config.digest.batch_size
+
+    def init_journal(self):
+        self.journal.batch_delay = self.config.journal.fsync_batch_ms / 1000
+        self.journal.load()
+        if self._journal_replayer is None:
+            self._journal_replayer = asyncio.create_task(self._replay_journal_loop())
+
+    def traced(self, name: str, func: Callable[..., Awaitable[T]]) -> Callable[..., Awaitable[T]]:
+        async def _wrapper(*args):
+            with self.tracer.span(name):
+                return await func(*args)
+        return _wrapper
+
+    async def guard(self, name: str, aw: Awaitable[T]) -> T:
+        with self.tracer.span(name):
+            return await self.breakers.call(name, aw)
+
+    def create_database_option(self, config: RequestBoardConfig):
+        if config.database.type == "mysql":
+            conf = config.database.mysql
+            return MySQLOption(
                 host=conf.host,
                 port=conf.port,
                 database=conf.database,
                 username=conf.username,
                 password=conf.password,
-            ))
+                replicas=[(replica.host, replica.port) for replica in conf.replicas],
+                sticky_seconds=conf.replica_sticky_seconds,
+            )
         else:
-            conf = self.config.database.sqlite
+            conf = config.database.sqlite
             db_path = self.data_dir / conf.path
             db_path.parent.mkdir(exist_ok=True)
-            await self.db.connect(SQLiteOption(
+            return SQLiteOption(
                 file_path=db_path.as_posix(),
-            ))
+            )
+
+    async def init_database(self):
+        await self.db.connect(self.create_database_option(self.config), self.config.database.lock)
 
     async def close_database(self):
         await self.db.close()
 
+    async def load_boards(self):
+        if self.config.boards:
+            log.info("Migrating %s boards from config to database", len(self.config.boards))
+            for board in self.config.boards:
+                await self.save_board(board)
+            self.config.boards.clear()
+            self.config.save()
+
+        boards = []
+        for row in await self.db.get_boards():
+            try:
+                boards.append(deserialize_board(row.data))
+            except Exception as e:
+                log.error("Failed to load board (%s): %s", row.id, e)
+        self.boards = boards
+
+    async def save_board(self, board: Board):
+        await self.db.save_board(board.id, board.guild, serialize_board(board))
+
     async def _init_discord(self):
+        self._init_discord_ok = True
         if not (client := DNCoreAPI.client()):
-            self._init_discord_ok = True
             return
 
-        client.add_view(self.discussion_create_channel_view)
-        client.add_view(self.discussion_close_channel_view)
-        client.add_view(self.discussion_reopen_channel_view)
+        timer = PhaseTimer()
+        with timer.phase("views"):
+            client.add_view(self.discussion_create_channel_view)
+            client.add_view(self.discussion_close_channel_view)
+            client.add_view(self.discussion_reopen_channel_view)
+            for board in self.boards:
+                # register interaction
+                self.register_board_view(board)
+
+        with timer.phase("panels"):
+            for board in self.boards:
+                # check message content
+                await asyncio.create_task(self.update_panel_content(board))
+                DNCoreAPI.run_coroutine(self.compact_discussion_categories(board))
+                self.refill_discussion_channel_pool(board)
+
+        with timer.phase("idle"):
+            await self.load_idle_deadlines()
+        self.start_outbox()
+        self.digest.start()
+        log.info("Initialized discord in %.1fms (%s)", timer.total, timer.format())
+
+    def register_board_view(self, board: Board):
+        if not (b_id := board.new_request_button_id) or not (client := DNCoreAPI.client()):
+            return
+        if old_view := self._board_views.pop(b_id, None):
+            old_view.stop()
+        self._board_views[b_id] = view = self.create_new_request_view(board, b_id)
+        client.add_view(view)
+
+    def unregister_board_view(self, button_id: str):
+        if view := self._board_views.pop(button_id, None):
+            view.stop()
+
+    # reload
+
+    async def reload_config(self) -> list[str]:
+        old, new = self.config, RequestBoardConfig(self.config_path)
+        new.load()
+        changes = []
+
+        # database
+        if ((new_option := self.create_database_option(new)) != self.create_database_option(old)
+                or new.database.lock != old.database.lock):
+            await self.db.swap(new_option, new.database.lock)
+            changes.append("database")
+
+        self.config = new
+
+        if (new.member_cache.size, new.member_cache.ttl_seconds, new.member_cache.negative_ttl_seconds) != (
+                old.member_cache.size, old.member_cache.ttl_seconds, old.member_cache.negative_ttl_seconds):
+            conf = new.member_cache
+            self.member_cache = MemberCache(conf.size, conf.ttl_seconds, conf.negative_ttl_seconds)
+            changes.append("member_cache")
+
+        if (new.outbox.concurrency, new.outbox.retry_base_seconds, new.outbox.retry_max_seconds,
+                new.outbox.max_attempts) != (old.outbox.concurrency, old.outbox.retry_base_seconds,
+                                             old.outbox.retry_max_seconds, old.outbox.max_attempts):
+            if self.outbox:
+                await self.outbox.stop()
+                self.outbox = None
+                self.start_outbox()
+            changes.append("outbox")
+
+        if (new.timeouts.discord, new.timeouts.database, new.timeouts.failure_threshold, new.timeouts.reset_seconds,
+                dict(new.timeouts.operations)) != (old.timeouts.discord, old.timeouts.database,
+                                                   old.timeouts.failure_threshold, old.timeouts.reset_seconds,
+                                                   dict(old.timeouts.operations)):
+            self.init_breakers()
+            changes.append("timeouts")
+
+        self.init_admission()
+        # 実行中に trace on/off で切り替えた状態を、関係のない再読み込みで戻さない
+        if (new.tracing.enabled, new.tracing.threshold_ms, new.tracing.max_file_bytes, new.tracing.backup_count) != (
+                old.tracing.enabled, old.tracing.threshold_ms, old.tracing.max_file_bytes, old.tracing.backup_count):
+            self.init_tracer()
+            changes.append("tracing")
+        self.init_digest()
+        self.journal.batch_delay = new.journal.fsync_batch_ms / 1000
+
+        if new.discussion_channel_pool_size != old.discussion_channel_pool_size:
+            if self._init_discord_ok:
+                for board in self.boards:
+                    self.refill_discussion_channel_pool(board)
+            changes.append("discussion_channel_pool_size")
+
+        if new.create_cool_times != old.create_cool_times:
+            changes.append("create_cool_times")
+
+        if new.watch_config_interval != old.watch_config_interval:
+            self.start_config_watcher()
+            changes.append("watch_config_interval")
+
+        # boards
+        panel_format_changed = new.panel_format.to_dict() != old.panel_format.to_dict()
+        if panel_format_changed:
+            changes.append("panel_format")
+
+        if changed_boards := await self.reload_boards(panel_format_changed=panel_format_changed):
+            changes.append(f"boards({changed_boards})")
+        return changes
+
+    async def reload_boards(self, *, panel_format_changed=False) -> int:
+        old_boards = {board.id: serialize_board(board) for board in self.boards}
+        await self.load_boards()
+        changed = 0
+
+        button_ids = {b.new_request_button_id for b in self.boards if b.new_request_button_id}
+        for button_id in set(self._board_views) - button_ids:
+            self.unregister_board_view(button_id)
+
+        for board in self.boards:
+            if old_boards.get(board.id) != serialize_board(board):
+                changed += 1
+                if self._init_discord_ok:
+                    self.register_board_view(board)
+                    DNCoreAPI.run_coroutine(self.update_panel_content(board))
+
+            elif panel_format_changed and board.panel_format is None and self._init_discord_ok:
+                DNCoreAPI.run_coroutine(self.update_panel_content(board))
+
+        changed += len(set(old_boards) - {board.id for board in self.boards})
+        if changed and self._init_discord_ok:
+            await self.load_idle_deadlines()
+        return changed
+
+    def start_config_watcher(self):
+        # 監視中の処理から呼ばれたときは自分を止めず、再読み込みを終えてから抜けさせる
+        if (watcher := self._config_watcher) and watcher is not asyncio.current_task():
+            watcher.cancel()
+        self._config_watcher = None
+        if interval := self.config.watch_config_interval:
+            self._config_watcher = asyncio.create_task(self._watch_config(interval))
+
+    async def _watch_config(self, interval: int):
+        def _mtime():
+            try:
+                return self.config_path.stat().st_mtime
+            except OSError:
+                return None
+
+        last_mtime = _mtime()
+        while self._config_watcher is asyncio.current_task():
+            await asyncio.sleep(interval)
+            if (mtime := _mtime()) == last_mtime or mtime is None:
+                continue
+            last_mtime = mtime
+            try:
+                changes = await self.reload_config()
+            except Exception as e:
+                log.error("Failed to reload config: %s", e)
+            else:
+                log.info("Reloaded config: %s", ", ".join(changes) or "no changes")
 
-        for board in self.config.boards:
-            # register interaction
-            if b_id := board.new_request_button_id:
-                client.add_view(self.create_new_request_view(board, b_id))
-            # check message content
-            await asyncio.create_task(self.update_panel_content(board))
+    def start_outbox(self):
+        if self.outbox:
+            return
+        conf = self.config.outbox
+        self.outbox = OutboxWorker(self.db, {
+            ACTION_UPDATE_FORUM_MESSAGE: self._outbox_update_forum_message,
+            ACTION_SEND_DISCUSSION_MESSAGE: self._outbox_send_discussion_message,
+        }, concurrency=conf.concurrency, retry_base=conf.retry_base_seconds, retry_max=conf.retry_max_seconds,
+            max_attempts=conf.max_attempts)
+        self.outbox.start()
+
+    def notify_outbox(self):
+        if self.outbox:
+            self.outbox.notify()
+
+    async def _outbox_update_forum_message(self, order_id: UUID):
+        if order := await self.db.get_order_record(order_id, primary=True):
+            await self.update_board_forum_message(order)
+
+    async def _outbox_send_discussion_message(self, order_id: UUID):
+        if not (order := await self.db.get_order_record(order_id, primary=True)) or not order.discussion_channel:
+            return
+        try:
+            channel = await self.guard(
+                "discord.fetch_channel", DNCoreAPI.client().fetch_channel(order.discussion_channel))
+        except discord.NotFound:
+            return
+        await self.guard("discord.send_message", send_discussion_channel_new_message(channel, order))
 
     #
 
@@ -148,6 +507,10 @@ class RequestBoardPlugin(Plugin):
     def create_new_request_view(self, board: Board, b_id: str):
 
         async def on_submit(inter: discord.Interaction, res: discord.InteractionResponse, values: RequestValues):
+            self.remember_member(inter.user)
+            if remaining := self.get_cooldown_remaining(board, inter.user.id):
+                return await send_cooldown_message(res, remaining)
+
             try:
                 result = await self.create_and_send_new_request(board, values, inter.user)
             except Exception as e:
@@ -165,11 +528,14 @@ class RequestBoardPlugin(Plugin):
             except (Exception,):
                 pass
 
-        async def on_click(res: discord.InteractionResponse):
-            modal = create_request_modal(on_submit)
+        async def on_click(inter: discord.Interaction, res: discord.InteractionResponse):
+            if remaining := self.get_cooldown_remaining(board, inter.user.id):
+                return await send_cooldown_message(res, remaining)
+
+            modal = create_request_modal(self.traced("submit.new_request", on_submit), self.admission)
             await res.send_modal(modal)
 
-        return create_new_request_view(b_id, on_click)
+        return create_new_request_view(b_id, self.traced("button.new_request", on_click), self.admission)
 
     async def create_and_send_new_request(self, board: Board, values: RequestValues, user: discord.User) -> bool:
         if not (ch_id := board.forum_channel.id):
@@ -177,7 +543,7 @@ class RequestBoardPlugin(Plugin):
             return False
 
         try:
-            channel = await DNCoreAPI.client().fetch_channel(ch_id)
+            channel = await self.guard("discord.fetch_channel", DNCoreAPI.client().fetch_channel(ch_id))
         except discord.HTTPException as e:
             log.warning("フォーラムチャンネルを取得できませんでした: (ch:%s, b_id:%s): %s",
                         ch_id, board.new_request_button_id, str(e))
@@ -200,15 +566,21 @@ class RequestBoardPlugin(Plugin):
         if th_m := await self.create_request_thread(channel, order):
             order.forum_message = th_m.message.id
             order.forum_message_channel = th_m.message.channel.id
-            order_id = await self.db.add_order(order)
+            order_id = await self.write_new_order(order)
+            self.order_cache.put(OrderRecord._make(getattr(order, name) for name in OrderRecord._fields))
+            self.record_cooldown(board, user.id)
+            await self.remember_forum_message_digest(order_id, get_forum_message_digest(
+                create_request_form_embed(order), self.discussion_create_channel_view))
             log.info("Created order (%s) by '%s' %s/%s", order_id, str(user), values.mcid, values.title)
+            self.add_digest_event("new", board, order)
             return True
         return False
 
     def create_discussion_channel_view(self):
 
         async def on_click(inter: discord.Interaction, res: discord.InteractionResponse):
-            order = await self.db.get_order_by_forum_message_id(inter.message.id)
+            self.remember_member(inter.user)
+            order = await self.find_order_record(inter.message.id)
             if not order:
                 log.warning("Cannot find order (from forum message '%s') by %s",
                             inter.message.id, inter.user)
@@ -224,7 +596,7 @@ class RequestBoardPlugin(Plugin):
 
             if order.discussion_channel:
                 try:
-                    await inter.client.fetch_channel(order.discussion_channel)
+                    await self.guard("discord.fetch_channel", inter.client.fetch_channel(order.discussion_channel))
                 except discord.NotFound:
                     pass
                 except discord.HTTPException:
@@ -273,17 +645,21 @@ class RequestBoardPlugin(Plugin):
                 pass
             return
 
-        return create_single_button_view("open_discussion_channel", "チャンネルを作成", on_click)
+        return create_single_button_view(
+            "open_discussion_channel", "チャンネルを作成",
+            self.traced("button.open_discussion_channel", on_click), self.admission,
+        )
 
     async def create_request_thread(
-        self, channel: discord.ForumChannel, order: RequestOrder,
+        self, channel: discord.ForumChannel, order: RequestOrder | OrderRecord,
     ) -> discord.channel.ThreadWithMessage | None:
 
         em = create_request_form_embed(order)
         view = self.discussion_create_channel_view
 
         try:
-            return await channel.create_thread(name=order.title, embed=em, view=view)
+            return await self.guard(
+                "discord.create_thread", channel.create_thread(name=order.title, embed=em, view=view))
         except discord.HTTPException as e:
             log.error(f"スレッドを作成/送信できませんでした: チャンネル {channel.id}: {e}")
             return
@@ -304,68 +680,277 @@ class RequestBoardPlugin(Plugin):
         # me_perms.manage_permissions = True  # なぜかカテゴリへの権限のみでは不十分だったので
         return {user: perms, me: me_perms}  # TODO: 閉じるが効かなくなる
 
-    async def create_discussion_channel(self, board: Board, order: RequestOrder):
-        if not ((category_id := board.discussion_channel_category) and (category_id := category_id.id)):
-            raise ReadableError("カテゴリチャンネルが設定されていません")
+    async def create_discussion_channel(self, board: Board, order: OrderRecord) -> discord.TextChannel:
+        return await self.single_flight.do(
+            ("create", order.id), lambda: self._create_discussion_channel(board, order))
+
+    async def _create_discussion_channel(self, board: Board, order: OrderRecord):
+        if opened := await self.open_pooled_discussion_channel(board, order):
+            discussion, order_user = opened
+        else:
+            discussion, order_user = await self.create_new_discussion_channel(board, order)
+
+        await self.write_order_changes(
+            order.id, dict(discussion_channel=discussion.id, discussion_closed=None),
+            actions=(ACTION_UPDATE_FORUM_MESSAGE, ACTION_SEND_DISCUSSION_MESSAGE))
+
+        log.info("Created discussion channel (%s) by '%s' %s/%s",
+                 order.id, str(order_user), order.mcid, order.title)
+        self.touch_discussion_idle(order)
+        self.add_digest_event("opened", board, order)
+        self.notify_outbox()
+        return discussion
 
+    async def create_new_discussion_channel(self, board: Board, order: OrderRecord):
+        category = await self.reserve_discussion_category(board)
         try:
-            category = await DNCoreAPI.client().fetch_channel(category_id)
-        except discord.HTTPException as e:
-            log.error(f"Error in get category channel ({category_id}): {e}")
-            raise ReadableError("カテゴリチャンネルを取得できませんでした")
+            order_user = await self.get_order_member(category.guild, order)
+
+            try:
+                discussion = await self.guard("discord.create_text_channel", category.guild.create_text_channel(
+                    name=order.title,
+                    category=category,
+                    position=0,
+                    overwrites={
+                        category.guild.me: get_me_permission(),
+                        order_user: get_discussion_user_permission(),
+                    },
+                ))
+
+            except discord.HTTPException as e:
+                log.error(f"Error in create discussion channel by {order.discord_user}: {e}")
+                raise ReadableError(f"チャンネルを作成できませんでした: {e}")
+
+            self._category_recent_channels.setdefault(category.id, {})[discussion.id] = time.monotonic()
+        finally:
+            self._category_pending[category.id] -= 1
+        return discussion, order_user
+
+    # discussion channel pool
+
+    async def open_pooled_discussion_channel(self, board: Board, order: OrderRecord):
+        if not self.config.discussion_channel_pool_size:
+            return None
+        if not (guild := DNCoreAPI.client().get_guild(board.guild)):
+            return None
 
-        if not isinstance(category, discord.CategoryChannel):
-            log.error("Not a category channel: %s/%s", category.id, category.name)
-            raise ReadableError("カテゴリではないチャンネルがカテゴリチャンネルとして設定されています")
+        # 取り出した後に失敗してチャンネルを取り残さないよう、先に解決しておく
+        order_user = await self.get_order_member(guild, order)
 
         try:
-            if not (order_user := category.guild.get_member(order.discord_user)):
-                order_user = await category.guild.fetch_member(order.discord_user)
-        except discord.HTTPException as e:
-            log.error(f"Error in get member ({order.discord_user}): {e}")
-            raise ReadableError("リクエストユーザーを取得できませんでした")
+            while pooled := await self.db.take_pooled_channel(board.id):
+                if (channel := await self.get_pooled_channel(guild, pooled)) is None:
+                    continue
+                if isinstance(channel, discord.TextChannel) and channel.category_id in self.get_board_category_ids(board):
+                    break
+                # カテゴリ設定が変更された古いチャンネル
+                DNCoreAPI.run_coroutine(self.guard("discord.delete_channel", channel.delete()))
+            else:
+                self.pool_misses += 1
+                return None
+        except discord.HTTPException:
+            self.pool_misses += 1
+            return None
+        finally:
+            self.refill_discussion_channel_pool(board)
 
         try:
-            discussion = await category.guild.create_text_channel(
+            await self.guard("discord.edit_channel", channel.edit(
                 name=order.title,
-                category=category,
                 position=0,
                 overwrites={
-                    category.guild.me: get_me_permission(),
+                    channel.guild.me: get_me_permission(),
                     order_user: get_discussion_user_permission(),
                 },
-            )
+            ))
+        except BaseException as e:
+            # 途中まで変更されているかもしれないので、プールには戻さず削除する
+            log.warning(f"Failed to open pooled channel ({channel.id}): {e!r}")
+            self.pool_misses += 1
+            DNCoreAPI.run_coroutine(self.guard("discord.delete_channel", channel.delete()))
+            if isinstance(e, discord.HTTPException):
+                return None
+            raise
+
+        self.pool_hits += 1
+        return channel, order_user
+
+    async def get_pooled_channel(self, guild: discord.Guild, pooled: PooledChannel):
+        if channel := guild.get_channel(pooled.channel_id):
+            return channel
+        try:
+            return await self.guard("discord.fetch_channel", DNCoreAPI.client().fetch_channel(pooled.channel_id))
+        except (discord.NotFound, discord.Forbidden):
+            log.debug("Dropped missing pooled channel (%s)", pooled.channel_id)
+            return None  # 削除済みか見えないチャンネルなので、プールから外すだけ
+        except BaseException:
+            # 確かめられなかったものは、あとで使えるようにプールへ戻す
+            await self.return_pooled_channel(pooled)
+            raise
+
+    async def return_pooled_channel(self, pooled: PooledChannel):
+        try:
+            await self.db.add_pooled_channel(pooled.channel_id, pooled.board_id, pooled.category_id)
+        except Exception as e:
+            log.warning("Failed to return pooled channel (%s): %s", pooled.channel_id, e)
+
+    def get_board_category_ids(self, board: Board) -> set[int]:
+        ids = set(board.discussion_channel_overflow_categories)
+        if (category := board.discussion_channel_category) and (category_id := getattr(category, "id", category)):
+            ids.add(category_id)
+        return ids
+
+    def refill_discussion_channel_pool(self, board: Board):
+        if not self.config.discussion_channel_pool_size or board.id in self._pool_refilling:
+            return
+        self._pool_refilling.add(board.id)
+        DNCoreAPI.run_coroutine(self._refill_discussion_channel_pool(board))
 
-        except discord.HTTPException as e:
-            log.error(f"Error in create discussion channel by {order.discord_user}: {e}")
-            raise ReadableError(f"チャンネルを作成できませんでした: {e}")
+    async def _refill_discussion_channel_pool(self, board: Board):
+        try:
+            while await self.db.count_pooled_channels(board.id) < self.config.discussion_channel_pool_size:
+                category = await self.reserve_discussion_category(board)
+                try:
+                    channel = await self.guard("discord.create_text_channel", category.guild.create_text_channel(
+                        name="pooled",
+                        category=category,
+                        overwrites={
+                            category.guild.default_role: discord.PermissionOverwrite(view_channel=False),
+                            category.guild.me: get_me_permission(),
+                        },
+                    ))
+                    self._category_recent_channels.setdefault(category.id, {})[channel.id] = time.monotonic()
+                finally:
+                    self._category_pending[category.id] -= 1
+
+                await self.db.add_pooled_channel(channel.id, board.id, category.id)
+                log.debug("Added pooled channel (%s) for board %s", channel.id, board.id)
+
+        except Exception as e:
+            log.warning("Failed to refill channel pool for board %s: %s", board.id, e)
+        finally:
+            self._pool_refilling.discard(board.id)
+
+    # discussion categories
+
+    async def get_category_channel(self, guild: discord.Guild | None, category_id: int):
+        if guild and (category := guild.get_channel(category_id)):
+            return category
+        return await self.guard("discord.fetch_channel", DNCoreAPI.client().fetch_channel(category_id))
+
+    def count_category_channels(self, category: discord.CategoryChannel) -> int:
+        # 作成直後のチャンネルはまだキャッシュに反映されていないことがあるため合わせて数える
+        known = {channel.id for channel in category.channels}
+        recent = self._category_recent_channels.get(category.id, {})
+        expired = time.monotonic() - 60
+        for channel_id, created in list(recent.items()):
+            if channel_id in known or created < expired:
+                del recent[channel_id]
+        return len(known) + len(recent) + self._category_pending[category.id]
+
+    async def reserve_discussion_category(self, board: Board) -> discord.CategoryChannel:
+        if not ((category_id := board.discussion_channel_category) and (category_id := category_id.id)):
+            raise ReadableError("カテゴリチャンネルが設定されていません")
 
-        async with self.db.modify_order(order.id) as _order:
-            _order.discussion_channel = discussion.id
-            _order.discussion_closed = None
+        guild = DNCoreAPI.client().get_guild(board.guild)
+        lock = self._category_locks.setdefault(board.id, asyncio.Lock())
+        async with lock:
+            try:
+                category = await self.get_category_channel(guild, category_id)
+            except discord.HTTPException as e:
+                log.error(f"Error in get category channel ({category_id}): {e}")
+                raise ReadableError("カテゴリチャンネルを取得できませんでした")
 
-        log.info("Created discussion channel (%s) by '%s' %s/%s",
-                 order.id, str(order_user), order.mcid, order.title)
+            if not isinstance(category, discord.CategoryChannel):
+                log.error("Not a category channel: %s/%s", category.id, category.name)
+                raise ReadableError("カテゴリではないチャンネルがカテゴリチャンネルとして設定されています")
 
-        order = await self.db.get_order(order.id)
-        DNCoreAPI.run_coroutine(self.update_board_forum_message(order))
-        DNCoreAPI.run_coroutine(send_discussion_channel_new_message(discussion, order))
-        return discussion
+            categories = [category]
+            for overflow_id in board.discussion_channel_overflow_categories:
+                if isinstance(overflow := category.guild.get_channel(overflow_id), discord.CategoryChannel):
+                    categories.append(overflow)
 
-    async def update_board_forum_message(self, order: RequestOrder):
-        if not (m_id := order.forum_message) or not (ch_id := order.forum_message_channel):
-            return False
+            for category in categories:
+                if self.count_category_channels(category) < DISCUSSION_CATEGORY_LIMIT:
+                    break
+            else:
+                category = await self.create_overflow_category(board, categories)
+
+            self._category_pending[category.id] += 1
 
+        DNCoreAPI.run_coroutine(self.compact_discussion_categories(board))
+        return category
+
+    async def create_overflow_category(self, board: Board, categories: list[discord.CategoryChannel]):
+        base = categories[0]
         try:
-            channel = await DNCoreAPI.client().fetch_channel(ch_id)
-            message = await channel.fetch_message(m_id)
-        except discord.NotFound:
-            return False
+            category = await self.guard("discord.create_category", base.guild.create_category(
+                name=f"{base.name}-{len(categories) + 1}",
+                overwrites=base.overwrites,
+                position=categories[-1].position + 1,
+            ))
         except discord.HTTPException as e:
-            log.warning(f"Unable to update forum board message: {e}")
+            log.error(f"Error in create overflow category ({base.id}): {e}")
+            raise ReadableError(f"追加のカテゴリチャンネルを作成できませんでした: {e}")
+
+        board.discussion_channel_overflow_categories.append(category.id)
+        await self.save_board(board)
+        log.info("Created overflow category (%s) for board %s", category.id, board.id)
+        return category
+
+    async def compact_discussion_categories(self, board: Board):
+        if not board.discussion_channel_overflow_categories:
+            return
+        if not (guild := DNCoreAPI.client().get_guild(board.guild)):
+            return
+
+        lock = self._category_locks.setdefault(board.id, asyncio.Lock())
+        async with lock:
+            remaining = []
+            for category_id in board.discussion_channel_overflow_categories:
+                category = guild.get_channel(category_id)
+                if not isinstance(category, discord.CategoryChannel):
+                    continue  # 削除されている
+                if self.count_category_channels(category) > 0:
+                    remaining.append(category_id)
+                    continue
+
+                try:
+                    await self.guard("discord.delete_channel", category.delete())
+                except discord.NotFound:
+                    pass
+                except discord.HTTPException as e:
+                    log.warning(f"Failed to delete empty overflow category ({category_id}): {e}")
+                    remaining.append(category_id)
+                    continue
+                log.info("Deleted empty overflow category (%s) for board %s", category_id, board.id)
+
+            if remaining != board.discussion_channel_overflow_categories:
+                board.discussion_channel_overflow_categories = remaining
+                await self.save_board(board)
+
+    def render_order_embed(self, order: OrderRecord) -> Embed:
+        # 同じ内容 (バージョン) の注文は作成済みの埋め込みを使う
+        if (em := self._rendered_embeds.get(order)) is not None:
+            self._rendered_embeds.move_to_end(order)
+            return em
+        em = self._rendered_embeds[order] = create_request_form_embed(order)
+        while len(self._rendered_embeds) > 1000:
+            self._rendered_embeds.popitem(last=False)
+        return em
+
+    async def remember_forum_message_digest(self, order_id: UUID, digest: str | None):
+        # 省略の判定に使うだけなので、保存できなくても処理は続ける
+        try:
+            await self.db.set_forum_message_digest(order_id, digest)
+        except Exception as e:
+            log.warning("Failed to save forum message digest (%s): %s", order_id, e)
+
+    async def update_board_forum_message(self, order: OrderRecord):
+        if not (m_id := order.forum_message) or not (ch_id := order.forum_message_channel):
             return False
 
-        em = create_request_form_embed(order)
+        em = self.render_order_embed(order)
         if not order.discussion_channel:
             view = self.discussion_create_channel_view
         elif order.discussion_closed:
@@ -373,15 +958,25 @@ class RequestBoardPlugin(Plugin):
         else:
             view = self.discussion_close_channel_view
 
+        # 別のプロセスが編集していることもあるので、最後に送った内容は DB で共有する
+        digest = get_forum_message_digest(em, view)
+        if await self.db.get_forum_message_digest(order.id) == digest:
+            return True  # no changed
+
+        # 投稿スレッドのIDはチャンネルIDと同じなので、取得せずに編集する
+        message = DNCoreAPI.client().get_partial_messageable(ch_id).get_partial_message(m_id)
         try:
-            await message.edit(embed=em, view=view)
-        except discord.HTTPException as e:
-            log.warning(f"Error in update forum board message: {e}")
+            await self.guard("discord.edit_message", message.edit(embed=em, view=view))
+        except discord.NotFound:
+            await self.remember_forum_message_digest(order.id, None)
             return False
+
+        await self.remember_forum_message_digest(order.id, digest)
         return True
 
     async def on_close_channel_button(self, inter: discord.Interaction, res: discord.InteractionResponse):
-        order = await self.db.get_order_by_forum_message_id(inter.message.id)
+        self.remember_member(inter.user)
+        order = await self.find_order_record(inter.message.id)
         if not order:
             log.warning("Cannot find order (from forum message '%s') by %s",
                         inter.message.id, inter.user)
@@ -398,7 +993,8 @@ class RequestBoardPlugin(Plugin):
         channel = None
         if order.discussion_channel:
             try:
-                channel = await inter.client.fetch_channel(order.discussion_channel)
+                channel = await self.guard(
+                    "discord.fetch_channel", inter.client.fetch_channel(order.discussion_channel))
             except discord.NotFound:
                 pass
             except discord.HTTPException as e:
@@ -440,11 +1036,13 @@ class RequestBoardPlugin(Plugin):
         return create_single_button_view(
             "close_discussion_channel",
             "チャンネルを閉じる",
-            self.on_close_channel_button,
+            self.traced("button.close_discussion_channel", self.on_close_channel_button),
+            self.admission,
         )
 
     async def on_reopen_channel_button(self, inter: discord.Interaction, res: discord.InteractionResponse):
-        order = await self.db.get_order_by_forum_message_id(inter.message.id)
+        self.remember_member(inter.user)
+        order = await self.find_order_record(inter.message.id)
         if not order:
             log.warning("Cannot find order (from forum message '%s') by %s",
                         inter.message.id, inter.user)
@@ -461,7 +1059,8 @@ class RequestBoardPlugin(Plugin):
         channel = None
         if order.discussion_channel:
             try:
-                channel = await inter.client.fetch_channel(order.discussion_channel)
+                channel = await self.guard(
+                    "discord.fetch_channel", inter.client.fetch_channel(order.discussion_channel))
             except discord.NotFound:
                 pass
             except discord.HTTPException as e:
@@ -493,6 +1092,13 @@ class RequestBoardPlugin(Plugin):
                 pass
             return
 
+        if isinstance(inter.channel, discord.Thread) and inter.channel.archived:
+            # まとめて閉じたときにアーカイブされたスレッドは、戻さないとメッセージを編集できない
+            try:
+                await self.guard("discord.edit_channel", inter.channel.edit(archived=False))
+            except discord.HTTPException as e:
+                log.warning("Cannot unarchive thread (%s): %s", inter.channel.id, e)
+
         await self.update_discussion_channel_reopen(order, channel)
         try:
             await res.send_message(
@@ -508,68 +1114,413 @@ class RequestBoardPlugin(Plugin):
         return create_single_button_view(
             "reopen_discussion_channel",
             "チャンネルを開く",
-            self.on_reopen_channel_button,
+            self.traced("button.reopen_discussion_channel", self.on_reopen_channel_button),
+            self.admission,
         )
 
-    async def update_discussion_channel_closed(self, order: RequestOrder, channel: discord.TextChannel):
-        try:
-            if not (order_user := channel.guild.get_member(order.discord_user)):
-                order_user = await channel.guild.fetch_member(order.discord_user)
-        except discord.HTTPException as e:
-            log.error(f"Error in get member ({order.discord_user}): {e}")
-            raise ReadableError("リクエストユーザーを取得できませんでした")
+    async def update_discussion_channel_closed(self, order: OrderRecord, channel: discord.TextChannel):
+        return await self.single_flight.do(
+            ("close", order.id), lambda: self._update_discussion_channel_closed(order, channel))
 
+    async def _update_discussion_channel_closed(self, order: OrderRecord, channel: discord.TextChannel):
         try:
-            await channel.set_permissions(order_user, overwrite=None)
+            order_user = await self.member_cache.get(
+                channel.guild, order.discord_user,
+                fetch=lambda g, u: self.guard("discord.fetch_member", g.fetch_member(u)))
+            if order_user:  # サーバーにいなければ権限の変更は不要
+                await self.guard("discord.set_permissions", channel.set_permissions(order_user, overwrite=None))
             # await channel.edit(name="closed-" + order.title)
 
         except discord.HTTPException as e:
             log.error(f"Error in update discussion channel {channel.id}: {e}")
             raise ReadableError("チャンネルを編集できませんでした")
 
-        async with self.db.modify_order(order.id) as _order:
-            # _order.discussion_channel = None
-            _order.discussion_closed = datetime.datetime.now()
+        await self.write_order_changes(
+            order.id, dict(discussion_closed=datetime.datetime.now()), actions=(ACTION_UPDATE_FORUM_MESSAGE, ))
 
         log.info("Closed discussion channel (%s) by '%s' %s/%s",
-                 order.id, str(order_user), order.mcid, order.title)
-
-        order = await self.db.get_order(order.id)
-        DNCoreAPI.run_coroutine(self.update_board_forum_message(order))
+                 order.id, str(order_user or order.discord_user), order.mcid, order.title)
+        self.idle_scheduler.cancel(order.id)
+        self.add_digest_event("closed", self.get_board(order.board_id), order)
+        self.notify_outbox()
         return True
 
-    async def update_discussion_channel_reopen(self, order: RequestOrder, channel: discord.TextChannel):
-        try:
-            if not (order_user := channel.guild.get_member(order.discord_user)):
-                order_user = await channel.guild.fetch_member(order.discord_user)
-        except discord.HTTPException as e:
-            log.error(f"Error in get member ({order.discord_user}): {e}")
-            raise ReadableError("リクエストユーザーを取得できませんでした")
+    async def update_discussion_channel_reopen(self, order: OrderRecord, channel: discord.TextChannel):
+        return await self.single_flight.do(
+            ("reopen", order.id), lambda: self._update_discussion_channel_reopen(order, channel))
+
+    async def _update_discussion_channel_reopen(self, order: OrderRecord, channel: discord.TextChannel):
+        order_user = await self.get_order_member(channel.guild, order)
 
         try:
-            await channel.set_permissions(order_user, overwrite=get_discussion_user_permission())
-            await channel.edit(name=order.title)
+            await self.guard("discord.set_permissions", channel.set_permissions(
+                order_user, overwrite=get_discussion_user_permission()))
+            await self.guard("discord.edit_channel", channel.edit(name=order.title))
 
         except discord.HTTPException as e:
             log.error(f"Error in update discussion channel {channel.id}: {e}")
             raise ReadableError("チャンネルを編集できませんでした")
 
-        async with self.db.modify_order(order.id) as _order:
-            _order.discussion_channel = channel.id
-            _order.discussion_closed = None
+        await self.write_order_changes(
+            order.id, dict(discussion_channel=channel.id, discussion_closed=None),
+            actions=(ACTION_UPDATE_FORUM_MESSAGE, ))
 
         log.info("Reopen discussion channel (%s) by '%s' %s/%s",
                  order.id, str(order_user), order.mcid, order.title)
-
-        order = await self.db.get_order(order.id)
-        DNCoreAPI.run_coroutine(self.update_board_forum_message(order))
+        self.touch_discussion_idle(order)
+        self.add_digest_event("reopened", self.get_board(order.board_id), order)
+        self.notify_outbox()
         return True
 
+    # bulk
+
+    async def run_bounded(
+        self, items: list, func: Callable[..., Awaitable], on_progress: Callable[[int], Awaitable[None]] = None,
+    ) -> list:
+        semaphore = asyncio.Semaphore(max(1, self.config.bulk_concurrency))
+        done = 0
+
+        async def _run(item):
+            nonlocal done
+            async with semaphore:
+                try:
+                    return await func(item)
+                finally:
+                    done += 1
+                    if on_progress:
+                        await on_progress(done)
+
+        return await asyncio.gather(*map(_run, items), return_exceptions=True)
+
+    async def bulk_close_discussions(
+        self, board: Board, guild: discord.Guild, orders: list[OrderRecord], thread_mode: str = "archive",
+        on_progress: Callable[[str, int, int], Awaitable[None]] = None,
+    ) -> tuple[int, int, int]:
+        client = DNCoreAPI.client()
+
+        async def _revoke(order: OrderRecord):
+            channel = client.get_channel(order.discussion_channel)
+            if channel is None:
+                try:
+                    channel = await self.guard("discord.fetch_channel", client.fetch_channel(order.discussion_channel))
+                except discord.NotFound:
+                    return  # チャンネルがないので閉じるだけ
+            member = await self.member_cache.get(
+                guild, order.discord_user, fetch=lambda g, u: self.guard("discord.fetch_member", g.fetch_member(u)))
+            if member:  # サーバーにいなければ権限の変更は不要
+                await self.guard("discord.set_permissions", channel.set_permissions(member, overwrite=None))
+
+        async def _update_thread(order: OrderRecord):
+            if not await self.update_board_forum_message(order) or thread_mode == "keep":
+                return
+            thread = client.get_channel(order.forum_message_channel)
+            if thread is None:
+                thread = await self.guard("discord.fetch_channel", client.fetch_channel(order.forum_message_channel))
+            if isinstance(thread, discord.Thread):
+                await self.guard("discord.edit_channel", thread.edit(archived=True, locked=thread_mode == "lock"))
+
+        def _progress(label: str, total: int):
+            return (lambda done: on_progress(label, done, total)) if on_progress else None
+
+        # 権限の変更に失敗したものは閉じない
+        results = await self.run_bounded(orders, _revoke, _progress("権限の変更", len(orders)))
+        revoked = []
+        for order, result in zip(orders, results):
+            if isinstance(result, Exception):
+                log.warning("Failed to revoke discussion channel (%s): %s", order.id, result)
+            else:
+                revoked.append(order)
+
+        closed_at = datetime.datetime.now()
+        closed_ids = set(await self.db.close_orders(
+            [order.id for order in revoked], closed_at, actions=(ACTION_UPDATE_FORUM_MESSAGE, )))
+        closed = [order._replace(discussion_closed=closed_at) for order in revoked if order.id in closed_ids]
+        for order in closed:
+            self.order_cache.invalidate(order.id)
+            self.idle_scheduler.cancel(order.id)
+            self.add_digest_event("closed", board, order)
+        log.info("Bulk closed %s discussion channels in board %s", len(closed), board.id)
+
+        # アーカイブしたスレッドのメッセージは編集できないので、先に更新してからアーカイブする
+        results = await self.run_bounded(closed, _update_thread, _progress("スレッドの更新", len(closed)))
+        thread_errors = 0
+        for order, result in zip(closed, results):
+            if isinstance(result, Exception):
+                thread_errors += 1
+                log.warning("Failed to update forum thread (%s): %s", order.id, result)
+        self.notify_outbox()
+        return len(closed), len(orders) - len(revoked), thread_errors
+
+    # idle
+
+    def get_discussion_idle_timeout(self, board_id: UUID) -> int | None:
+        if (board := self.get_board(board_id)) and board.discussion_idle_timeout:
+            return board.discussion_idle_timeout * 60
+        return None
+
+    async def load_idle_deadlines(self):
+        self.idle_scheduler.clear()
+        for order in await self.db.get_open_discussion_orders():
+            if timeout := self.get_discussion_idle_timeout(order.board_id):
+                # 最終発言は期限が来た時にチャンネルから確認する
+                self.idle_scheduler.schedule(order.id, order.created.timestamp() + timeout)
+        self.idle_scheduler.start()
+        log.debug("Loaded %s idle deadlines", len(self.idle_scheduler))
+
+    def touch_discussion_idle(self, order: OrderRecord):
+        if timeout := self.get_discussion_idle_timeout(order.board_id):
+            self.idle_scheduler.touch(order.id, timeout)
+        else:
+            self.idle_scheduler.cancel(order.id)
+
+    async def on_discussion_idle(self, order_id: UUID):
+        order = await self.db.get_order_record(order_id)
+        if not order or not order.discussion_channel or order.discussion_closed:
+            return
+        if not (timeout := self.get_discussion_idle_timeout(order.board_id)):
+            return
+
+        try:
+            channel = await self.guard(
+                "discord.fetch_channel", DNCoreAPI.client().fetch_channel(order.discussion_channel))
+        except discord.NotFound:
+            return
+        except discord.HTTPException as e:
+            log.warning("Cannot fetch channel (%s): %s", order.discussion_channel, str(e))
+            self.idle_scheduler.touch(order.id, 60)
+            return
+
+        if not isinstance(channel, discord.TextChannel):
+            return
+
+        last_active = channel.created_at
+        if channel.last_message_id:
+            last_active = max(last_active, discord.utils.snowflake_time(channel.last_message_id))
+
+        if (deadline := last_active.timestamp() + timeout) > time.time():
+            self.idle_scheduler.schedule(order.id, deadline)
+            return
+
+        log.info("Closing idle discussion channel (%s) %s/%s", order.id, order.mcid, order.title)
+        await self.update_discussion_channel_closed(order, channel)
+
+    # journal
+
+    async def write_new_order(self, order: RequestOrder, actions: tuple[str, ...] = ()) -> UUID:
+        if order.id is None:
+            order.id = new_order_id()
+
+        # 未反映の記録がある間は順番を守るため、すべて記録に回す
+        if not len(self.journal):
+            try:
+                return await self.db.add_order(order, actions)
+            except Exception as e:
+                if not is_database_unavailable(e):
+                    raise
+                log.warning("Database unavailable, journaling new order (%s): %s", order.id, e)
+
+        await self.journal.append_order(order, actions)
+        return order.id
+
+    async def write_order_changes(self, order_id: UUID, values: dict, actions: tuple[str, ...] = ()):
+        try:
+            if not len(self.journal):
+                try:
+                    return await self.db.update_order(order_id, values, actions)
+                except Exception as e:
+                    if not is_database_unavailable(e):
+                        raise
+                    log.warning("Database unavailable, journaling order changes (%s): %s", order_id, e)
+
+            await self.journal.append_update(order_id, values, actions)
+        finally:
+            self.order_cache.invalidate(order_id)
+
+    async def apply_journal_entry(self, entry: dict):
+        if entry["op"] == "add_order":
+            values = decode_order_values(entry["order"])
+            if await self.db.get_order_record(values["id"], primary=True):
+                return  # 反映済み
+            await self.db.add_order(RequestOrder(**values), entry["actions"])
+
+        elif entry["op"] == "update_order":
+            await self.db.update_order(
+                UUID(entry["order_id"]), decode_order_values(entry["values"]), entry["actions"])
+
+        else:
+            raise ValueError(f"Unknown journal entry: {entry['op']}")
+
+    async def replay_journal(self) -> int:
+        applied = 0
+        try:
+            for entry in self.journal.entries():
+                try:
+                    await self.apply_journal_entry(entry)
+                except Exception as e:
+                    if is_database_unavailable(e):
+                        raise
+                    log.error("Dropped journal entry %s: %s", entry, e)
+                applied += 1
+        finally:
+            if applied:
+                await self.journal.discard(applied)
+                self.notify_outbox()
+        return applied
+
+    async def _replay_journal_loop(self):
+        while True:
+            if len(self.journal):
+                try:
+                    applied = await self.replay_journal()
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    log.warning("Failed to replay journal (%s left): %s", len(self.journal), e)
+                else:
+                    log.info("Replayed %s journal entries (%s left)", applied, len(self.journal))
+            await asyncio.sleep(self.config.journal.replay_interval_seconds)
+
+    # orders
+
+    async def find_order_record(self, forum_message_id: int) -> OrderRecord | None:
+        if cached := self.order_cache.get(forum_message_id):
+            record, verified = cached
+            if not verified:
+                # スナップショットから戻したものは、使いつつ裏でDBと照らし合わせる
+                DNCoreAPI.run_coroutine(self.verify_cached_order_record(record))
+            return record
+
+        if record := await self.db.get_order_record_by_forum_message_id(forum_message_id):
+            self.order_cache.put(record)
+        return record
+
+    async def verify_cached_order_record(self, record: OrderRecord):
+        self.order_cache.put(record)  # 確認中に重複して照会しないように
+        try:
+            latest = await self.db.get_order_record(record.id)
+        except Exception as e:
+            log.warning("Failed to verify cached order (%s): %s", record.id, e)
+            self.order_cache.invalidate(record.id)
+            return
+
+        if latest is None:
+            self.order_cache.invalidate(record.id)
+        elif latest != record:
+            log.debug("Cached order (%s) was outdated", record.id)
+            self.order_cache.put(latest)
+
+    def get_cooldown_remaining(self, board: Board, user_id: int) -> float:
+        if not self.config.create_cool_times or (created := self._cooldowns.get((board.id, user_id))) is None:
+            return 0
+        return max(0.0, created + self.config.create_cool_times * 60 - time.time())
+
+    def record_cooldown(self, board: Board, user_id: int):
+        if not self.config.create_cool_times:
+            return
+        now = time.time()
+        if len(self._cooldowns) > 10000:
+            expires = now - self.config.create_cool_times * 60
+            self._cooldowns = {key: created for key, created in self._cooldowns.items() if created > expires}
+        self._cooldowns[(board.id, user_id)] = now
+
+    # snapshot
+
+    def save_snapshot(self):
+        if not self.config.snapshot.enabled:
+            return
+
+        expires = time.time() - (self.config.create_cool_times or 0) * 60
+        state = dict(
+            orders=[encode_order_values(record._asdict()) for record in self.order_cache.records()],
+            cooldowns=[(str(board_id), user_id, created)
+                       for (board_id, user_id), created in self._cooldowns.items() if created > expires],
+        )
+        try:
+            write_snapshot(self.snapshot_path, state)
+        except Exception as e:
+            log.warning("Failed to write snapshot: %s", e)
+            return
+        log.info("Saved snapshot (orders: %s, cooldowns: %s)", len(state["orders"]), len(state["cooldowns"]))
+
+    def load_snapshot(self):
+        if not self.config.snapshot.enabled:
+            return
+        state = read_snapshot(self.snapshot_path, self.config.snapshot.max_age_seconds)
+        # 異常終了後に古い状態を読み直さないよう、一度読んだら消す
+        self.snapshot_path.unlink(missing_ok=True)
+        if not state:
+            return
+
+        board_ids = {board.id for board in self.boards}
+        try:
+            orders = [OrderRecord(**decode_order_values(values)) for values in state["orders"]]
+            cooldowns = {(UUID(board_id), int(user_id)): float(created)
+                         for board_id, user_id, created in state["cooldowns"]}
+        except (KeyError, TypeError, ValueError) as e:
+            log.warning("Ignored snapshot: %s", e)
+            return
+
+        for record in orders:
+            if record.board_id in board_ids:
+                self.order_cache.put(record, verified=False)
+        for key, created in cooldowns.items():
+            self._cooldowns[key] = max(created, self._cooldowns.get(key, 0))
+        log.info("Loaded snapshot (orders: %s, cooldowns: %s)", len(self.order_cache), len(cooldowns))
+
+    # digest
+
+    def add_digest_event(self, kind: str, board: Board | None, order: RequestOrder | OrderRecord):
+        if not board or not board.digest_channel or not board.digest_channel.id:
+            return
+        self.digest.add(board.id, DigestEvent(
+            kind, order.id, order.title, order.mcid, order.discord_user, order.forum_message_channel,
+            datetime.datetime.now(),
+        ))
+
+    async def send_staff_digest(self, board_id: UUID, events: list[DigestEvent]):
+        if not (board := self.get_board(board_id)) or not board.digest_channel or not board.digest_channel.id:
+            return
+
+        em = Embed.info(title=f"リクエストの状況 ({len(events)}件)", content=None)
+        for kind, label in DIGEST_EVENT_LABELS.items():
+            if not (kind_events := [e for e in events if e.kind == kind]):
+                continue
+            lines = []
+            for e in kind_events:
+                target = f"<#{e.forum_thread}>" if e.forum_thread else e.title
+                lines.append(f"- {target} {e.mcid} (<@{e.discord_user}>)")
+            value = "\n".join(lines)
+            if len(value) > 1024:
+                value = value[:1000].rsplit("\n", 1)[0] + "\n…"
+            em.add_field(name=f"{label} ({len(kind_events)})", value=value, inline=False)
+
+        channel = DNCoreAPI.client().get_partial_messageable(board.digest_channel.id)
+        await self.guard("discord.send_message", channel.send(embed=em))
+
+    # member
+
+    def remember_member(self, user: discord.User | discord.Member):
+        if isinstance(user, discord.Member):
+            self.member_cache.put(user)
+
+    async def get_order_member(self, guild: discord.Guild, order: OrderRecord) -> discord.Member:
+        try:
+            member = await self.member_cache.get(
+                guild, order.discord_user, fetch=lambda g, u: self.guard("discord.fetch_member", g.fetch_member(u)))
+        except discord.HTTPException as e:
+            log.error(f"Error in get member ({order.discord_user}): {e}")
+            raise ReadableError("リクエストユーザーを取得できませんでした")
+
+        if member is None:
+            log.warning("Member not found (%s) in guild %s", order.discord_user, guild.id)
+            raise ReadableError("リクエストユーザーがサーバーに見つかりませんでした")
+        return member
+
     def get_guild_boards(self, guild_id: int):
-        return list(filter(lambda b: b.guild == guild_id, self.config.boards))
+        return list(filter(lambda b: b.guild == guild_id, self.boards))
 
     def get_board(self, board_id: UUID):
-        for board in self.config.boards:
+        for board in self.boards:
             if board.id == board_id:
                 return board
 
@@ -582,6 +1533,15 @@ class RequestBoardPlugin(Plugin):
         {command} add (ﾊﾟﾈﾙﾁｬﾝﾈﾙID) (ﾌｫｰﾗﾑﾁｬﾝﾈﾙID) [議論ﾁｬﾝﾈﾙｶﾃｺﾞﾘID]
         {command} <remove/preview/send> (ｲﾝﾃﾞｯｸｽ)
         {command} setChCate (ｲﾝﾃﾞｯｸｽ) (議論ﾁｬﾝﾈﾙｶﾃｺﾞﾘID / unset)
+        {command} setIdle (ｲﾝﾃﾞｯｸｽ) (自動で閉じるまでの分数 / unset)
+        {command} setDigest (ｲﾝﾃﾞｯｸｽ) (まとめ通知ﾁｬﾝﾈﾙID / unset)
+        {command} reload
+        {command} status
+        {command} stats (ｲﾝﾃﾞｯｸｽ) [日数]
+        {command} rebuildStats
+        {command} closeAll (ｲﾝﾃﾞｯｸｽ) [経過日数] [archive/lock/keep]
+        {command} trace [on/off]
+        {command} profile [秒数]
         """
         args = ctx.args
         try:
@@ -659,8 +1619,8 @@ class RequestBoardPlugin(Plugin):
             if discussion_channel_category:
                 board.discussion_channel_category = discussion_channel_category.id
 
-            self.config.boards.append(board)
-            self.config.save()
+            self.boards.append(board)
+            await self.save_board(board)
 
             boards = self.get_guild_boards(ctx.guild.id)
 
@@ -685,8 +1645,8 @@ class RequestBoardPlugin(Plugin):
             except IndexError:
                 return await ctx.send_warn(f":warning: 1 から {len(boards)} で指定してください")
 
-            self.config.boards.remove(board)
-            self.config.save()
+            self.boards.remove(board)
+            await self.db.remove_board(board.id)
 
             has_error = False
             try:
@@ -797,7 +1757,7 @@ class RequestBoardPlugin(Plugin):
                 return await ctx.send_error(":warning: 内部エラーが発生しました")
 
             board.panel_message = MessageId(m.id, m.channel.id)
-            self.config.save()
+            await self.save_board(board)
             await ctx.send_info(f":ok_hand: パネルメッセージを送信しました: {m.jump_url}")
 
         elif mode in ("setchannelcategory", "setchcate"):
@@ -837,7 +1797,7 @@ class RequestBoardPlugin(Plugin):
                                 f":warning: <#{discussion_channel_category_id}> がカテゴリチャンネルではありません")
                 board.discussion_channel_category = discussion_channel_category.id
 
-            self.config.save()
+            await self.save_board(board)
             if board.discussion_channel_category:
                 m_text = "議論チャンネルを作成するカテゴリチャンネルを設定しました"
             else:
@@ -845,5 +1805,257 @@ class RequestBoardPlugin(Plugin):
 
             return await ctx.send_info(f":ok_hand: {m_text}")
 
+        elif mode == "reload":
+            try:
+                async with ctx.typing():
+                    changes = await self.reload_config()
+            except Exception as e:
+                log.error("Exception in reload config", exc_info=e)
+                return await ctx.send_error(f":warning: 設定を再読み込みできませんでした: {e}")
+
+            if not changes:
+                return await ctx.send_info(":ok_hand: 設定を再読み込みしました (変更なし)")
+            return await ctx.send_info(":ok_hand: 設定を再読み込みしました: " + ", ".join(changes))
+
+        elif mode == "status":
+            def _format_breaker(b: CircuitBreaker):
+                icon = {
+                    CircuitBreaker.CLOSED: ":green_circle:",
+                    CircuitBreaker.HALF_OPEN: ":yellow_circle:",
+                    CircuitBreaker.OPEN: ":red_circle:",
+                }.get(b.state, ":white_circle:")
+                return (f"{icon} `{b.name}` {b.state} (呼出 {b.total_calls} / 失敗 {b.total_failures}"
+                        f" / 拒否 {b.total_rejected})")
+
+            breakers = sorted(self.breakers.breakers.values(), key=lambda b: b.name)
+            lines = "\n".join(map(_format_breaker, breakers)) or "まだ呼び出しがありません"
+
+            adm = self.admission
+            admission_lines = (f"処理中 {adm.inflight}/{adm.max_inflight} / 待機中 {adm.waiting}/{adm.max_queue}\n"
+                               f"受付 {adm.admitted} / 待機後受付 {adm.queued} / 拒否 {adm.shed}")
+            if guild_shed := adm.shed_by_guild.get(ctx.guild.id):
+                admission_lines += f" (このサーバー {guild_shed})"
+
+            pool_lines = ""
+            if self.config.discussion_channel_pool_size:
+                total = self.pool_hits + self.pool_misses
+                pool_lines = (f"\n\n:gear: 議論チャンネルの事前作成\n使用 {self.pool_hits} / 不足 {self.pool_misses}"
+                              f" (ヒット率 {self.pool_hits / total * 100 if total else 0:.0f}%)")
+
+            journal_lines = ""
+            if len(self.journal) or self.journal.appended:
+                journal_lines = (f"\n\n:gear: DB未反映の記録\n残り {len(self.journal)} / 記録 {self.journal.appended}"
+                                 f" (fsync {self.journal.fsyncs})")
+
+            return await ctx.send_info(
+                ":gear: 外部サービスの状態\n" + lines + "\n\n:gear: 受付状況\n" + admission_lines
+                + pool_lines + journal_lines)
+
+        elif mode == "stats":
+            try:
+                board_index = int(args.pop(0))
+            except IndexError:
+                return await ctx.send_warn(":grey_exclamation: ボード番号を指定してください")
+            except ValueError:
+                return await ctx.send_warn(":grey_exclamation: ボード番号を数値で指定してください")
+            try:
+                days = max(1, int(args.get(0, 7)))
+            except ValueError:
+                return await ctx.send_warn(":grey_exclamation: 日数を数値で指定してください")
+
+            boards = self.get_guild_boards(ctx.guild.id)
+            try:
+                if not 0 < board_index <= len(boards):
+                    raise IndexError
+                board = boards[board_index - 1]
+            except IndexError:
+                return await ctx.send_warn(f":warning: 1 から {len(boards)} で指定してください")
+
+            since = datetime.date.today() - datetime.timedelta(days=days - 1)
+            total, recent = await self.db.get_stats(board.id, since)
+            top = await self.db.get_top_requesters(board.id)
+
+            def _format_counts(counts: dict[str, int]):
+                return (f"作成 {counts['created']} / 議論 {counts['discussed']}"
+                        f" / クローズ {counts['closed']} / 再開 {counts['reopened']}")
+
+            top_lines = "\n".join(f"{n}. <@{user}> {count}件" for n, (user, count) in enumerate(top, 1))
+            return await ctx.send_info(
+                f":bar_chart: <#{board.forum_channel.id}> の統計\n"
+                f"直近{days}日: {_format_counts(recent)}\n"
+                f"全期間: {_format_counts(total)}\n\n"
+                f":bust_in_silhouette: 作成数の多いユーザー\n{top_lines or 'なし'}")
+
+        elif mode in ("closeall", "close_all"):
+            try:
+                board_index = int(args.pop(0))
+            except IndexError:
+                return await ctx.send_warn(":grey_exclamation: ボード番号を指定してください")
+            except ValueError:
+                return await ctx.send_warn(":grey_exclamation: ボード番号を数値で指定してください")
+
+            days = None
+            thread_mode = "archive"
+            while args:
+                value = args.pop(0).lower()
+                if value in ("archive", "lock", "keep"):
+                    thread_mode = value
+                elif value.isdigit():
+                    days = int(value)
+                else:
+                    raise CommandUsageError()
+
+            boards = self.get_guild_boards(ctx.guild.id)
+            try:
+                if not 0 < board_index <= len(boards):
+                    raise IndexError
+                board = boards[board_index - 1]
+            except IndexError:
+                return await ctx.send_warn(f":warning: 1 から {len(boards)} で指定してください")
+
+            orders = await self.db.get_open_discussion_orders(board.id)
+            if days is not None:
+                threshold = datetime.datetime.now() - datetime.timedelta(days=days)
+                orders = [order for order in orders if order.created <= threshold]
+            if not orders:
+                return await ctx.send_info(":ok_hand: 閉じる議論チャンネルはありません")
+
+            progress_message = await ctx.channel.send(
+                embed=Embed.info(f":hourglass: {len(orders)} 件の議論チャンネルを閉じています…"))
+            last_progress = 0.0
+
+            async def _on_progress(label: str, done: int, total: int):
+                nonlocal last_progress
+                if done < total and time.monotonic() - last_progress < 2:
+                    return
+                last_progress = time.monotonic()
+                try:
+                    await progress_message.edit(embed=Embed.info(f":hourglass: {label} {done}/{total}"))
+                except discord.HTTPException:
+                    pass
+
+            closed, failed, thread_errors = await self.bulk_close_discussions(
+                board, ctx.guild, orders, thread_mode, _on_progress)
+
+            m_text = f":ok_hand: {closed} 件の議論チャンネルを閉じました"
+            if failed:
+                m_text += f"\n:warning: {failed} 件は権限を変更できなかったため閉じていません"
+            if thread_errors:
+                m_text += f"\n:warning: {thread_errors} 件のスレッドを更新できませんでした"
+            try:
+                await progress_message.delete()
+            except discord.HTTPException:
+                pass
+            return await ctx.send_info(m_text)
+
+        elif mode in ("rebuildstats", "rebuild_stats"):
+            rows = await self.db.rebuild_stats()
+            return await ctx.send_info(f":ok_hand: 統計を再集計しました (ボード・日ごとの集計 {rows} 件)")
+
+        elif mode == "trace":
+            if (value := args.get(0, "").lower()) in ("on", "off"):
+                self.tracer.enabled = value == "on"
+
+            state = "有効" if self.tracer.enabled else "無効"
+            return await ctx.send_info(
+                f":gear: トレースは{state}です (しきい値 {self.tracer.threshold:.0f}ms, 記録数 {self.tracer.written})")
+
+        elif mode == "profile":
+            try:
+                seconds = min(60, max(1, int(args.get(0, 10))))
+            except ValueError:
+                return await ctx.send_warn(":grey_exclamation: 秒数を数値で指定してください")
+
+            profiler = SamplingProfiler(self._loop_thread_id or threading.main_thread().ident)
+            await ctx.send_info(f":stopwatch: {seconds}秒間プロファイルを取得しています…")
+            await asyncio.to_thread(profiler.run, seconds)
+
+            path = self.data_dir / f"profile-{datetime.datetime.now():%Y%m%d-%H%M%S}.txt"
+            await asyncio.to_thread(profiler.write, path)
+            lines = "\n".join(f"`{name}` {count}" for name, count in profiler.top_functions(10))
+            return await ctx.send_info(
+                f":ok_hand: {profiler.samples} サンプルを {path.name} に保存しました\n" + lines)
+
+        elif mode in ("setdigest", "setdigestchannel"):
+            try:
+                board_index = int(args.pop(0))
+            except IndexError:
+                return await ctx.send_warn(":grey_exclamation: ボード番号を指定してください")
+            except ValueError:
+                return await ctx.send_warn(":grey_exclamation: ボード番号を数値で指定してください")
+
+            boards = self.get_guild_boards(ctx.guild.id)
+            try:
+                if not 0 < board_index <= len(boards):
+                    raise IndexError
+                board = boards[board_index - 1]
+            except IndexError:
+                return await ctx.send_warn(f":warning: 1 から {len(boards)} で指定してください")
+
+            if args.get(0, "").lower() == "unset":
+                await self.digest.flush(board.id)
+                board.digest_channel = None
+            else:
+                try:
+                    digest_channel_id = args.get_channel(0)
+                    args.pop(0)
+                except IndexError:
+                    raise CommandUsageError()
+                except ValueError:
+                    return await ctx.send_warn(":grey_exclamation: チャンネルを数値で指定してください")
+                try:
+                    digest_channel = await ctx.client.fetch_channel(digest_channel_id, force=True)
+                except discord.HTTPException as e:
+                    return await ctx.send_warn(f":warning: <#{digest_channel_id}> にアクセスできません: {e}")
+                if not isinstance(digest_channel, discord.abc.Messageable):
+                    return await ctx.send_warn(f":warning: <#{digest_channel_id}> にメッセージを送信できません")
+                board.digest_channel = ChannelId(digest_channel.id)
+
+            await self.save_board(board)
+            if board.digest_channel:
+                m_text = f"<#{board.digest_channel.id}> にまとめ通知を送信します"
+            else:
+                m_text = "まとめ通知を解除しました"
+
+            return await ctx.send_info(f":ok_hand: {m_text}")
+
+        elif mode in ("setidle", "setidletimeout"):
+            try:
+                board_index = int(args.pop(0))
+            except IndexError:
+                return await ctx.send_warn(":grey_exclamation: ボード番号を指定してください")
+            except ValueError:
+                return await ctx.send_warn(":grey_exclamation: ボード番号を数値で指定してください")
+
+            boards = self.get_guild_boards(ctx.guild.id)
+            try:
+                if not 0 < board_index <= len(boards):
+                    raise IndexError
+                board = boards[board_index - 1]
+            except IndexError:
+                return await ctx.send_warn(f":warning: 1 から {len(boards)} で指定してください")
+
+            if args.get(0, "").lower() == "unset":
+                board.discussion_idle_timeout = None
+            else:
+                try:
+                    idle_timeout = int(args.pop(0))
+                    if idle_timeout <= 0:
+                        raise ValueError
+                except IndexError:
+                    raise CommandUsageError()
+                except ValueError:
+                    return await ctx.send_warn(":grey_exclamation: 分数を1以上の数値で指定してください")
+                board.discussion_idle_timeout = idle_timeout
+
+            await self.save_board(board)
+            await self.load_idle_deadlines()
+            if board.discussion_idle_timeout:
+                m_text = f"{board.discussion_idle_timeout}分間操作がない議論チャンネルを自動で閉じます"
+            else:
+                m_text = "議論チャンネルの自動クローズを解除しました"
+
+            return await ctx.send_info(f":ok_hand: {m_text}")
+
         else:
             raise CommandUsageError()
@@ -0,0 +1,117 @@
+import asyncio
+import heapq
+import itertools
+import time
+from logging import getLogger
+from typing import Awaitable, Callable, Hashable
+
+log = getLogger(__name__)
+__all__ = [
+    "DeadlineScheduler",
+]
+
+
+class DeadlineScheduler(object):
+    def __init__(
+        self, on_expire: Callable[[Hashable], Awaitable[None]], *, retry_base: float = 60, retry_max: float = 3600,
+    ):
+        self._on_expire = on_expire
+        self.retry_base = retry_base
+        self.retry_max = retry_max
+        self._failures = {}  # type: dict[Hashable, int]
+        self._heap = []  # type: list[tuple[float, int, Hashable]]
+        self._deadlines = {}  # type: dict[Hashable, float]
+        self._counter = itertools.count()
+        self._wakeup = asyncio.Event()
+        self._task = None  # type: asyncio.Task | None
+
+    def __len__(self):
+        return len(self._deadlines)
+
+    def __contains__(self, key: Hashable):
+        return key in self._deadlines
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def clear(self):
+        self._heap.clear()
+        self._deadlines.clear()
+        self._failures.clear()
+        self._wakeup.set()
+
+    def schedule(self, key: Hashable, deadline: float):
+        current = self._deadlines.get(key)
+        self._deadlines[key] = deadline
+
+        # 期限の延長はヒープに積まず、取り出した時に積み直す
+        if current is None or deadline < current:
+            heapq.heappush(self._heap, (deadline, next(self._counter), key))
+            if self._heap[0][2] == key:
+                self._wakeup.set()
+
+    def touch(self, key: Hashable, delay: float):
+        self.schedule(key, time.time() + delay)
+
+    def cancel(self, key: Hashable):
+        self._deadlines.pop(key, None)
+        self._failures.pop(key, None)
+
+    def deadline(self, key: Hashable) -> float | None:
+        return self._deadlines.get(key)
+
+    def _pop_expired(self) -> tuple[list[Hashable], float | None]:
+        expired = []
+        now = time.time()
+        while self._heap:
+            deadline, _, key = self._heap[0]
+            current = self._deadlines.get(key)
+
+            if current != deadline:
+                heapq.heappop(self._heap)
+                if current is not None and current > deadline:
+                    heapq.heappush(self._heap, (current, next(self._counter), key))
+                continue
+
+            if deadline > now:
+                return expired, deadline - now
+
+            heapq.heappop(self._heap)
+            self._deadlines.pop(key, None)
+            expired.append(key)
+        return expired, None
+
+    async def _run(self):
+        while True:
+            self._wakeup.clear()
+            expired, timeout = self._pop_expired()
+
+            for key in expired:
+                try:
+                    await self._on_expire(key)
+                except Exception as e:
+                    log.exception("Exception in deadline handler: %s", key, exc_info=e)
+                    # 失敗したものは間隔を空けてやり直す (処理中に新しい期限が入っていればそちらを使う)
+                    if key not in self._deadlines:
+                        failures = self._failures[key] = self._failures.get(key, 0) + 1
+                        self.touch(key, min(self.retry_max, self.retry_base * 2 ** (failures - 1)))
+                else:
+                    self._failures.pop(key, None)
+
+            if expired:
+                continue
+
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
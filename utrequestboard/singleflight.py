@@ -0,0 +1,23 @@
+import asyncio
+from typing import Awaitable, Callable, Hashable, TypeVar
+
+__all__ = [
+    "SingleFlight",
+]
+T = TypeVar("T")
+
+
+class SingleFlight(object):
+    def __init__(self):
+        self._calls = {}  # type: dict[Hashable, asyncio.Task]
+
+    def __contains__(self, key: Hashable):
+        return key in self._calls
+
+    async def do(self, key: Hashable, func: Callable[[], Awaitable[T]]) -> T:
+        if not (task := self._calls.get(key)):
+            task = self._calls[key] = asyncio.ensure_future(func())
+            task.add_done_callback(lambda _: self._calls.pop(key, None))
+
+        # 呼び出し元がキャンセルされても他の待機者のために処理は続ける
+        return await asyncio.shield(task)
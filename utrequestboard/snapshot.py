@@ -0,0 +1,45 @@
+import json
+import os
+import time
+from logging import getLogger
+from pathlib import Path
+
+log = getLogger(__name__)
+__all__ = [
+    "SNAPSHOT_VERSION",
+    "write_snapshot",
+    "read_snapshot",
+]
+# 中身の形式を変えたら上げる
+SNAPSHOT_VERSION = 2
+
+
+# 再起動後すぐにキャッシュが効くよう、停止時にメモリ上の状態を保存する
+# 読み込むだけでコードが実行されないよう JSON にし、UUID や日時は呼び出し側で文字列にする
+def write_snapshot(path: Path, state: dict):
+    data = dict(state, version=SNAPSHOT_VERSION, created=time.time())
+    tmp_path = path.with_name(path.name + ".tmp")
+    with tmp_path.open("w", encoding="utf-8") as file:
+        json.dump(data, file, ensure_ascii=False)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(tmp_path, path)
+
+
+def read_snapshot(path: Path, max_age: float) -> dict | None:
+    try:
+        with path.open("r", encoding="utf-8") as file:
+            data = json.load(file)
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        log.warning("Ignored snapshot: %s", e)
+        return None
+
+    if not isinstance(data, dict) or data.get("version") != SNAPSHOT_VERSION:
+        log.info("Ignored snapshot: version mismatch")
+        return None
+    if (age := time.time() - data.get("created", 0)) > max_age:
+        log.info("Ignored snapshot: too old (%.0fs)", age)
+        return None
+    return data
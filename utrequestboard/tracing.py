@@ -0,0 +1,200 @@
+import datetime
+import json
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from logging import getLogger
+from pathlib import Path
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+log = getLogger(__name__)
+__all__ = [
+    "Span",
+    "Tracer",
+    "SamplingProfiler",
+    "PhaseTimer",
+]
+_current_span = ContextVar("utrequestboard_span", default=None)
+
+
+class Span(object):
+    __slots__ = ("name", "attrs", "start", "end", "children")
+
+    def __init__(self, name: str, attrs: dict, start: float = None):
+        self.name = name
+        self.attrs = attrs
+        self.start = time.perf_counter() if start is None else start
+        self.end = None  # type: float | None
+        self.children = []  # type: list[Span]
+
+    @property
+    def duration(self) -> float:
+        return ((self.end or time.perf_counter()) - self.start) * 1000
+
+    def to_dict(self, origin: float):
+        data = dict(name=self.name, start=round((self.start - origin) * 1000, 3), duration=round(self.duration, 3))
+        if self.attrs:
+            data["attrs"] = self.attrs
+        if self.children:
+            data["children"] = [child.to_dict(origin) for child in self.children]
+        return data
+
+
+class Tracer(object):
+    def __init__(self):
+        self.enabled = False
+        self.threshold = 500.0
+        self.path = None  # type: Path | None
+        self.max_bytes = 5 * 1024 * 1024
+        self.backup_count = 3
+        self.written = 0
+
+    def configure(self, enabled: bool, threshold: float, path: Path, max_bytes: int, backup_count: int):
+        self.enabled = enabled
+        self.threshold = threshold
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+
+    @contextmanager
+    def span(self, name: str, **attrs):
+        if not self.enabled:
+            yield None
+            return
+
+        parent = _current_span.get()  # type: Span | None
+        span = Span(name, attrs)
+        if parent is not None:
+            parent.children.append(span)
+        token = _current_span.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.attrs["error"] = repr(e)
+            raise
+        finally:
+            span.end = time.perf_counter()
+            _current_span.reset(token)
+            if parent is None:
+                self._finish(span)
+
+    def _finish(self, root: Span):
+        if root.duration < self.threshold or not self.path:
+            return
+
+        data = root.to_dict(root.start)
+        data["time"] = datetime.datetime.now().isoformat()
+        try:
+            self._rotate()
+            with self.path.open("a", encoding="utf-8") as file:
+                file.write(json.dumps(data, ensure_ascii=False, default=str) + "\n")
+            self.written += 1
+        except OSError as e:
+            log.warning("Failed to write trace: %s", e)
+
+    def _rotate(self):
+        try:
+            if self.path.stat().st_size < self.max_bytes:
+                return
+        except FileNotFoundError:
+            return
+
+        for index in range(self.backup_count - 1, 0, -1):
+            src = self.path.with_name(f"{self.path.name}.{index}")
+            if src.exists():
+                os.replace(src, self.path.with_name(f"{self.path.name}.{index + 1}"))
+        if self.backup_count > 0:
+            os.replace(self.path, self.path.with_name(f"{self.path.name}.1"))
+        else:
+            self.path.unlink()
+
+    def install(self, engine: AsyncEngine):
+        sync_engine = engine.sync_engine
+
+        @event.listens_for(sync_engine, "before_cursor_execute")
+        def _before(_conn, _cursor, statement, _parameters, context, _executemany):
+            if self.enabled and (parent := _current_span.get()) is not None:
+                span = Span("sql", dict(statement=statement[:500]))
+                parent.children.append(span)
+                context._utrequestboard_span = span
+
+        @event.listens_for(sync_engine, "after_cursor_execute")
+        def _after(_conn, _cursor, _statement, _parameters, context, _executemany):
+            if span := getattr(context, "_utrequestboard_span", None):
+                span.end = time.perf_counter()
+
+
+class SamplingProfiler(object):
+    def __init__(self, thread_id: int, interval: float = 0.005):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.samples = 0
+        self.stacks = Counter()  # type: Counter[str]
+        self._lock = threading.Lock()
+        self.running = False
+
+    def run(self, duration: float):
+        with self._lock:
+            self.running = True
+            self.samples = 0
+            self.stacks.clear()
+            try:
+                deadline = time.monotonic() + duration
+                while time.monotonic() < deadline:
+                    if frame := sys._current_frames().get(self.thread_id):
+                        self.stacks[self._collapse(frame)] += 1
+                        self.samples += 1
+                    time.sleep(self.interval)
+            finally:
+                self.running = False
+
+    @staticmethod
+    def _collapse(frame) -> str:
+        names = []
+        while frame is not None:
+            code = frame.f_code
+            names.append(f"{Path(code.co_filename).name}:{code.co_name}:{frame.f_lineno}")
+            frame = frame.f_back
+        return ";".join(reversed(names))
+
+    def write(self, path: Path):
+        # flamegraph.pl などで読める形式
+        with path.open("w", encoding="utf-8") as file:
+            for stack, count in self.stacks.most_common():
+                file.write(f"{stack} {count}\n")
+
+    def top_functions(self, limit: int = 10) -> list[tuple[str, int]]:
+        counter = Counter()
+        for stack, count in self.stacks.items():
+            counter[stack.rsplit(";", 1)[-1]] += count
+        return counter.most_common(limit)
+
+
+class PhaseTimer(object):
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.phases = []  # type: list[tuple[str, float]]
+
+    @contextmanager
+    def phase(self, name: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, (time.perf_counter() - started) * 1000)
+
+    def add(self, name: str, duration: float):
+        self.phases.append((name, duration))
+
+    @property
+    def total(self) -> float:
+        return (time.perf_counter() - self.started) * 1000
+
+    def format(self) -> str:
+        return ", ".join(f"{name} {duration:.1f}ms" for name, duration in self.phases)